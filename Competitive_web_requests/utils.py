@@ -1,24 +1,11 @@
-import time, asyncio, functools
-
-from typing import Callable, Any
+import asyncio, os, sys
 
 from aiohttp import ClientSession
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень, см. timing.py
 
-def async_timed():
-    def wrapper(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapped(*args, **kwargs) -> Any:
-            print(f'выполняется {func} с аргументами {args} {kwargs}')
-            start = time.time()
-            try:
-                return await func(*args, **kwargs)
-            finally:
-                end = time.time()
-                total = end - start
-                print(f'{func} завершилась за {total:.4f} с')
-        return wrapped
-    return wrapper
+from timing import async_timed
+from tracing import traced
 
 
 async def delay(delay_seconds: int) -> int:
@@ -28,6 +15,7 @@ async def delay(delay_seconds: int) -> int:
     return delay_seconds
 
 
+@traced()
 async def fetch_status(session: ClientSession, url: str, delay: int = 0) -> int:
     await asyncio.sleep(delay)
     async with session.get(url) as result:
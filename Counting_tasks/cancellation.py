@@ -0,0 +1,157 @@
+# Снятие счетных задач в пуле процессов
+#
+# В main_as_completed из part_6_1 снятие задачи на стороне asyncio
+# не останавливает count(100000000): будущий объект run_in_executor
+# нельзя прервать, если функция уже выполняется в процессе-исполнителе,
+# и брошенная работа продолжает занимать ядро. Здесь два способа это исправить.
+#
+# CancellablePool - кооперативный. Каждой задаче выдается ячейка в разделяемом
+# массиве флагов. При снятии задачи (task.cancel(), тайм-аут asyncio.wait_for)
+# родитель поднимает флаг, а функция периодически вызывает check_cancelled()
+# и завершается с исключением TaskCancelled. Пул при этом остается рабочим.
+#
+# run_killable - для функций, которые не умеют проверять флаг: задача идет
+# в отдельном процессе, который при снятии просто убивается. Платим за это
+# запуском процесса на каждый вызов.
+
+import asyncio
+import os
+import time
+from multiprocessing import Array, Pipe, Process
+from typing import Any, Callable, List, Optional
+
+from pool_manager import ProcessPoolManager
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+_flags = None
+
+_slot: Optional[int] = None
+
+
+def _init_flags(flags):
+    global _flags
+    _flags = flags
+
+
+def check_cancelled():
+    if _flags is not None and _slot is not None and _flags[_slot]:
+        raise TaskCancelled()
+
+
+def _run_with_token(slot: int, fn: Callable[..., Any], args: tuple) -> Any:
+    global _slot
+    _slot = slot
+    try:
+        return fn(*args)
+    finally:
+        _slot = None
+
+
+def count_cancellable(count_to: int, check_every: int = 1_000_000) -> int:
+    # count из part_6_1, который раз в check_every итераций проверяет флаг
+    counter = 0
+    while counter < count_to:
+        counter = counter + 1
+        if counter % check_every == 0:
+            check_cancelled()
+    return counter
+
+
+class CancellablePool:
+    def __init__(self, max_workers: Optional[int] = None, slots: Optional[int] = None):
+        workers = max_workers or os.cpu_count() or 1
+        self.slots = slots or 4 * workers
+        self.flags = Array('b', self.slots, lock=False)
+        self._free: List[int] = list(range(self.slots))
+        self._available = asyncio.Semaphore(self.slots)
+        self.manager = ProcessPoolManager(workers, initializer=_init_flags, initargs=(self.flags,))
+
+    async def start(self):
+        await self.manager.start()
+
+    def _release(self, slot: int):
+        self._free.append(slot)
+        self._available.release()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        # Ячейка освобождается, только когда задача действительно завершилась
+        # в исполнителе, а не когда ее сняли в asyncio
+        await self._available.acquire()
+        slot = self._free.pop()
+        self.flags[slot] = 0
+        loop = asyncio.get_running_loop()
+        future = self.manager.pool.submit(_run_with_token, slot, fn, args)
+        future.add_done_callback(
+            lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release, slot))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self.flags[slot] = 1
+            raise
+
+    def shutdown(self):
+        for slot in range(self.slots):
+            self.flags[slot] = 1
+        self.manager.shutdown()
+
+
+def _process_target(connection, fn: Callable[..., Any], args: tuple):
+    try:
+        connection.send((True, fn(*args)))
+    except BaseException as ex:
+        connection.send((False, ex))
+
+
+async def run_killable(fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+    loop = asyncio.get_running_loop()
+    receiver, sender = Pipe(duplex=False)
+    process = Process(target=_process_target, args=(sender, fn, args), daemon=True)
+    process.start()
+    sender.close()
+    ready = loop.create_future()
+    loop.add_reader(receiver.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await asyncio.wait_for(ready, timeout)
+        try:
+            success, value = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f'Процесс завершился без результата, код {process.exitcode}')
+        if not success:
+            raise value
+        return value
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        process.kill()
+        raise
+    finally:
+        loop.remove_reader(receiver.fileno())
+        receiver.close()
+        process.join()
+
+
+async def main():
+    from part_6_1 import count
+
+    pool = CancellablePool()
+    await pool.start()
+    start = time.perf_counter()
+    try:
+        await pool.run(count_cancellable, 100000000, timeout=1)
+    except asyncio.TimeoutError:
+        print(f'count_cancellable снята по тайм-ауту через {time.perf_counter() - start:.2f} с')
+    # Исполнитель освободился и сразу берет следующую задачу
+    print(f'Следующая задача: {await pool.run(count, 1000)} за {time.perf_counter() - start:.2f} с')
+    pool.shutdown()
+
+    start = time.perf_counter()
+    try:
+        await run_killable(count, 100000000, timeout=1)
+    except asyncio.TimeoutError:
+        print(f'count убита по тайм-ауту через {time.perf_counter() - start:.2f} с')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+# Возобновляемый MapReduce с контрольными точками
+#
+# Если задачу из part_6_4 прервать, все посчитанное теряется, и файл
+# читается заново. Здесь результат каждой порции исполнитель сбрасывает
+# на диск в компактном двоичном формате (тот же, что и в shared_counters),
+# а родитель после этого дописывает диапазон в журнал job.log.
+# При перезапуске обрабатываются только диапазоны, которых нет в журнале,
+# затем все сброшенные счетчики сливаются попарно в пуле процессов.
+#
+# Порядок записи важен: файл порции сначала пишется во временный файл
+# и атомарно переименовывается, и только потом диапазон попадает в журнал.
+# Поэтому любая строка журнала ссылается на целый файл.
+#
+# path, как и в mapreduce.map_reduce, может быть шаблоном glob: журнал
+# ведется по каждому файлу, сжатый файл - одна порция целиком.
+#
+# Перед первой порцией файла в журнал пишется его размер и время изменения.
+# Если файл с тех пор заменили или дописали, старые порции к нему уже
+# не относятся, и продолжать задачу нельзя - run_job останавливается с ошибкой.
+
+import asyncio
+import functools
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mapreduce import NGRAM_FILE, ChunkSizer, file_ranges, input_files, map_range, merge_counters
+from shared_counters import pack_counter, read_counter
+
+
+JOURNAL = 'job.log'
+
+RESULT = 'result.bin'
+
+
+def save_counter(file_name: str, counter: Dict[str, int]):
+    temporary_name = f'{file_name}.tmp'
+    with open(temporary_name, 'wb') as f:
+        f.write(pack_counter(counter))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_name, file_name)
+
+
+def load_counter(file_name: str) -> Dict[str, int]:
+    with open(file_name, 'rb') as f:
+        return read_counter(f.read())
+
+
+def spill_map(map_function: Callable[[str, int, int], Dict[str, int]],
+              path: str, offset: int, length: int, directory: str) -> str:
+    path_hash = hashlib.md5(path.encode('utf-8')).hexdigest()[:8]
+    spill_name = f'map-{path_hash}-{offset:016d}-{length}.bin'
+    save_counter(os.path.join(directory, spill_name), map_function(path, offset, length))
+    return spill_name
+
+
+def merge_spills(first: str, second: str, directory: str) -> str:
+    # Промежуточные файлы слияния в журнал не попадают: после перезапуска
+    # слияние все равно начинается заново с файлов порций.
+    merged = merge_counters(load_counter(os.path.join(directory, first)),
+                            load_counter(os.path.join(directory, second)))
+    merged_name = f'merge-{uuid.uuid4().hex}.bin'
+    save_counter(os.path.join(directory, merged_name), merged)
+    for name in (first, second):
+        if name.startswith('merge-'):
+            os.remove(os.path.join(directory, name))
+    return merged_name
+
+
+def file_identity(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_journal(directory: str, path: str) -> Tuple[List[Tuple[int, int, str]], Optional[Tuple[int, int]]]:
+    # Строки журнала: путь, размер, время изменения, 'file' - описание файла;
+    # путь, смещение, длина, имя файла порции - готовая порция.
+    # Оборванная строка пропускается: последняя - по отсутствию '\n', а уже
+    # закрытая open_journal - потому что файла порции с обрезанным именем нет
+    # (имена порций начинаются с 'map-', поэтому 'file' из обрезка не получится).
+    completed = []
+    identity = None
+    journal = os.path.join(directory, JOURNAL)
+    if not os.path.exists(journal):
+        return completed, identity
+    with open(journal, encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                continue
+            fields = line[:-1].split('\t')
+            if fields[0] != path:
+                continue
+            if len(fields) != 4:
+                continue
+            if fields[3] == 'file':
+                identity = (int(fields[1]), int(fields[2]))
+            elif os.path.exists(os.path.join(directory, fields[3])):
+                completed.append((int(fields[1]), int(fields[2]), fields[3]))
+    if completed and identity != file_identity(path):
+        raise RuntimeError(f'Файл {path} изменился после прошлого запуска (размер или время изменения '
+                           f'не совпадают с журналом). Удалите каталог {directory}, чтобы начать заново')
+    return sorted(completed), identity
+
+
+def open_journal(directory: str):
+    # Если прошлую запись оборвали посреди строки, новая строка начнется
+    # с новой строки, а не допишется к оборванной
+    name = os.path.join(directory, JOURNAL)
+    journal = open(name, 'a', encoding='utf-8')
+    if journal.tell():
+        with open(name, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b'\n'
+        if torn:
+            journal.write('\n')
+    return journal
+
+
+def append_identity(journal, path: str):
+    size, mtime_ns = file_identity(path)
+    journal.write(f'{path}\t{size}\t{mtime_ns}\tfile\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def append_journal(journal, path: str, offset: int, length: int, spill_name: str):
+    journal.write(f'{path}\t{offset}\t{length}\t{spill_name}\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def remaining_ranges(size: int, completed: List[Tuple[int, int, str]]) -> List[Tuple[int, int]]:
+    gaps = []
+    position = 0
+    for offset, length, _ in completed:
+        if offset > position:
+            gaps.append((position, offset))
+        position = max(position, offset + length)
+    if position < size:
+        gaps.append((position, size))
+    return gaps
+
+
+async def run_job(directory: str,
+                  path: str = NGRAM_FILE,
+                  chunk_bytes: Optional[int] = None,
+                  map_function: Callable[[str, int, int], Dict[str, int]] = map_range,
+                  max_in_flight: Optional[int] = None) -> Dict[str, int]:
+    os.makedirs(directory, exist_ok=True)
+    result_name = os.path.join(directory, RESULT)
+    if os.path.exists(result_name):
+        print('Задача уже выполнена, читаем готовый результат')
+        return load_counter(result_name)
+    for name in os.listdir(directory):
+        if name.endswith('.tmp') or name.startswith('merge-'):
+            os.remove(os.path.join(directory, name))
+
+    loop = asyncio.get_running_loop()
+    workers = os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    work = []
+    spills = []
+    unrecorded = []
+    for file in input_files(path):
+        completed, identity = read_journal(directory, file)
+        if identity != file_identity(file):
+            unrecorded.append(file)
+        spills.extend(name for _, _, name in completed)
+        work.extend((file, start, end) for start, end in remaining_ranges(os.path.getsize(file), completed))
+    print(f'Уже обработано порций: {len(spills)}, осталось байтов: {sum(end - start for _, start, end in work)}')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open_journal(directory) as journal:
+        for file in unrecorded:
+            append_identity(journal, file)
+        pending = {}
+        for file, start, end in work:
+            next_size = chunk_bytes or ChunkSizer(end - start, workers)
+            for offset, length in file_ranges(file, next_size, start, end):
+                if len(pending) >= max_in_flight:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        done_file, done_offset, done_length = pending.pop(future)
+                        spill_name = future.result()
+                        append_journal(journal, done_file, done_offset, done_length, spill_name)
+                        spills.append(spill_name)
+                future = loop.run_in_executor(
+                    pool, functools.partial(spill_map, map_function, file, offset, length, directory))
+                pending[future] = (file, offset, length)
+
+        for future, (file, offset, length) in pending.items():
+            spill_name = await future
+            append_journal(journal, file, offset, length, spill_name)
+            spills.append(spill_name)
+
+        # Слияние сброшенных счетчиков попарно в пуле, в памяти родителя
+        # только имена файлов
+        while len(spills) > 1:
+            merges = [loop.run_in_executor(pool, functools.partial(merge_spills, spills[i], spills[i + 1], directory))
+                      for i in range(0, len(spills) - 1, 2)]
+            leftover = spills[-1:] if len(spills) % 2 else []
+            spills = list(await asyncio.gather(*merges)) + leftover
+
+    result = load_counter(os.path.join(directory, spills[0])) if spills else {}
+    save_counter(result_name, result)
+    if spills and spills[0].startswith('merge-'):
+        os.remove(os.path.join(directory, spills[0]))
+    return result
+
+
+async def main(directory: str = 'mapreduce-job', path: str = NGRAM_FILE):
+    # Задачу можно прервать по CTRL+C и запустить снова с тем же каталогом
+    start = time.time()
+    final_result = await run_job(directory, path)
+    print(f"Aardvark встречается {final_result['Aardvark']} раз.")
+    end = time.time()
+    print(f'Время MapReduce: {(end - start):.4f} секунд')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+# Сменные исполнители для счетных задач
+#
+# В part_6_1 main_gather и main_as_completed жестко создают
+# ProcessPoolExecutor(). Какой исполнитель быстрее, зависит от сборки Python:
+#   - 'process'     - пул процессов, по своей GIL в каждом процессе;
+#   - 'thread'      - пул потоков; для счетного кода имеет смысл только
+#                     в сборке без GIL (free-threaded, 3.13t и новее);
+#   - 'interpreter' - пул субинтерпретаторов со своей GIL у каждого
+#                     (concurrent.futures.InterpreterPoolExecutor, Python 3.14+).
+# run_cpu(fn, *args) выполняет функцию в исполнителе, выбранном через
+# configure() или переменную окружения CPU_BACKEND. По умолчанию это 'thread'
+# в сборке без GIL и 'process' во всех остальных.
+#
+# Если в текущем цикле событий запущен прогретый пул (pool_manager),
+# исполнитель 'process' берется из него, а не создается заново.
+#
+# map_batched(fn, iterable, batch_size) отправляет аргументы пачками:
+# одно сообщение (pickle + канал до исполнителя и обратно) на batch_size
+# вызовов вместо одного на каждый вызов, а результаты отдает асинхронным
+# итератором в порядке аргументов или по мере готовности.
+
+import asyncio
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from part_6_1 import count
+from pool_manager import current_manager
+
+
+BACKENDS = ('process', 'thread', 'interpreter')
+
+
+def gil_enabled() -> bool:
+    # sys._is_gil_enabled появилась в 3.13, в более старых версиях GIL есть всегда
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+
+def default_backend() -> str:
+    return os.environ.get('CPU_BACKEND') or ('process' if gil_enabled() else 'thread')
+
+
+def create_executor(backend: str, max_workers: Optional[int] = None) -> Executor:
+    if backend == 'process':
+        return ProcessPoolExecutor(max_workers=max_workers)
+    if backend == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+    if backend == 'interpreter':
+        interpreter_pool = getattr(concurrent.futures, 'InterpreterPoolExecutor', None)
+        if interpreter_pool is None:
+            raise RuntimeError('Пул субинтерпретаторов доступен начиная с Python 3.14')
+        return interpreter_pool(max_workers=max_workers)
+    raise ValueError(f'Неизвестный исполнитель {backend}, ожидается один из {BACKENDS}')
+
+
+_backend = default_backend()
+
+_executors: Dict[str, Executor] = {}
+
+
+def configure(backend: str):
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f'Неизвестный исполнитель {backend}, ожидается один из {BACKENDS}')
+    _backend = backend
+
+
+def get_executor(backend: Optional[str] = None) -> Executor:
+    # Исполнители создаются при первом обращении и живут до shutdown()
+    backend = backend or _backend
+    if backend not in _executors:
+        _executors[backend] = create_executor(backend)
+    return _executors[backend]
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any, backend: Optional[str] = None) -> Any:
+    manager = current_manager()
+    if manager is not None and (backend or _backend) == 'process':
+        return await manager.run(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(backend), functools.partial(fn, *args))
+
+
+def run_batch(fn: Callable[[Any], Any], batch: List[Any]) -> List[Any]:
+    # Выполняется в исполнителе: весь цикл по пачке - внутри одной задачи
+    return [fn(item) for item in batch]
+
+
+async def map_batched(fn: Callable[[Any], Any],
+                      iterable: Iterable[Any],
+                      batch_size: int = 256,
+                      ordered: bool = True,
+                      backend: Optional[str] = None,
+                      max_in_flight: Optional[int] = None) -> AsyncIterator[Any]:
+    # В работе (и в ожидании выдачи при ordered=True) не больше max_in_flight
+    # пачек, так что iterable может быть сколь угодно длинным.
+    max_in_flight = max_in_flight or 2 * (os.cpu_count() or 1)
+    items = iter(iterable)
+    pending: Dict[asyncio.Future, int] = {}
+    finished: Dict[int, List[Any]] = {}
+    submitted = 0
+    next_to_yield = 0
+    try:
+        while True:
+            while len(pending) + len(finished) < max_in_flight:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    break
+                task = asyncio.ensure_future(run_cpu(run_batch, fn, batch, backend=backend))
+                pending[task] = submitted
+                submitted += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch_index = pending.pop(task)
+                if ordered:
+                    finished[batch_index] = task.result()
+                else:
+                    for result in task.result():
+                        yield result
+            while next_to_yield in finished:
+                for result in finished.pop(next_to_yield):
+                    yield result
+                next_to_yield += 1
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+
+# ==================================================================
+# Масштабирование count по числу ядер для каждого исполнителя.
+# Общий объем работы постоянный и делится поровну между workers
+# исполнителями, поэтому в идеале время падает в workers раз.
+
+async def benchmark(count_to: int = 50_000_000, max_workers: Optional[int] = None):
+    loop = asyncio.get_running_loop()
+    max_workers = max_workers or os.cpu_count() or 1
+    for backend in BACKENDS:
+        baseline = None
+        for workers in range(1, max_workers + 1):
+            try:
+                executor = create_executor(backend, workers)
+            except RuntimeError as ex:
+                print(f'{backend}: {ex}')
+                break
+            with executor:
+                # Прогрев: запуск процессов или интерпретаторов не входит в замер
+                await asyncio.gather(*[loop.run_in_executor(executor, count, 1) for _ in range(workers)])
+                start = time.perf_counter()
+                await asyncio.gather(*[loop.run_in_executor(executor, count, count_to // workers)
+                                       for _ in range(workers)])
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f'{backend}, исполнителей {workers}: {elapsed:.4f} с, ускорение {baseline / elapsed:.2f}')
+
+
+# ==================================================================
+# Поштучная отправка против пачек для count с маленькими аргументами
+
+async def benchmark_batched(items: int = 20_000, batch_size: int = 256, backend: str = 'process'):
+    loop = asyncio.get_running_loop()
+    nums = [index % 100 for index in range(items)]
+    executor = get_executor(backend)
+    await run_cpu(count, 1, backend=backend)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[loop.run_in_executor(executor, count, num) for num in nums])
+    print(f'По одному: {time.perf_counter() - start:.4f} с')
+
+    start = time.perf_counter()
+    batched = [result async for result in map_batched(count, nums, batch_size, backend=backend)]
+    print(f'Пачками по {batch_size}: {time.perf_counter() - start:.4f} с')
+    assert batched == results
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
+    asyncio.run(benchmark_batched())
+    shutdown()
@@ -0,0 +1,458 @@
+# Потоковый MapReduce для набора Google Books Ngram
+#
+# В варианте из 6.4 родительский процесс читает весь файл через readlines(),
+# а затем каждую порцию строк сериализует (pickle) и отправляет исполнителю.
+# Пиковое потребление памяти получается в несколько раз больше самого файла.
+#
+# Здесь файл делится на диапазоны байтов, выровненные по границам строк.
+# Исполнителю передается только пара (смещение, длина), свой кусок файла
+# он читает сам. Одновременно в работе находится ограниченное число порций,
+# а частичные результаты сливаются по мере готовности - так потребление памяти
+# перестает зависеть от размера файла.
+#
+# Слияние (reduce) тоже выполняется в пуле процессов. Исполнитель
+# раскладывает свой частичный словарь на разделы по crc32 ключа, а части
+# одного раздела сливает исполнитель пула: по fan_in штук, пока идет
+# отображение, и все оставшиеся в конце. Ключ лежит ровно в одном разделе,
+# поэтому родитель только принимает готовые разделы, а результат
+# (PartitionedCounter) ищет ключ в его разделе.
+# (Попарное дерево слияний в пуле здесь проигрывает: на каждом уровне оба
+# словаря сериализуются из родителя и результат возвращается обратно.
+# Файлы отсортированы по слову, частичные словари почти не пересекаются,
+# и на 64 словарях по 20 тыс. ключей родитель тратил в 9 раз больше
+# процессорного времени, чем functools.reduce.)
+#
+# В режиме use_mmap исполнитель один раз отображает файл в память (mmap)
+# и берет свою порцию прямо из отображения. Родительский процесс данных
+# не касается вовсе, а страничный кэш ОС общий для всех исполнителей.
+#
+# Размер порции по умолчанию подбирается автоматически (ChunkSizer): стартовый
+# размер зависит от размера файла и числа исполнителей, а дальше меняется
+# по измеренному соотношению накладных расходов и полезной работы.
+#
+# С progress=True исполнители отмечают обработанные строки и байты в своих
+# ячейках разделяемой памяти (модуль progress), а родитель печатает скорость
+# и оценку оставшегося времени.
+#
+# Как части разделов передаются между процессами, задает shared_memory.
+# По умолчанию это словари, которые сериализуются (pickle) и проходят через
+# родителя. С shared_memory=True каждая часть кладется в блок разделяемой
+# памяти (модуль shared_counters), и родитель пересылает только описатели
+# блоков. Сравнение по процессорному времени родителя - benchmark_transport().
+#
+# Вместо одного файла можно передать шаблон glob (например, все 26 букв
+# 'googlebooks-eng-all-1gram-20120701-*'), в том числе сжатые .gz файлы.
+# Файлы обрабатываются в одном пуле от большего к меньшему, чтобы в конце
+# не остался один большой файл на одном ядре. Сжатый файл нельзя читать
+# с произвольного смещения, поэтому он целиком отдается одному исполнителю,
+# который распаковывает его блоками.
+
+import asyncio
+import functools
+import glob
+import gzip
+import itertools
+import mmap
+import os
+import time
+import zlib
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from progress import ProgressSlots, init_progress, progress_reporter, report_progress
+from shared_counters import SharedCounter, load_shared, start_resource_tracker, store_shared
+
+
+NGRAM_FILE = 'googlebooks-eng-all-1gram-20120701-a'
+
+MIN_CHUNK_BYTES = 1024 * 1024
+
+MAX_CHUNK_BYTES = 256 * 1024 * 1024
+
+GZIP_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Сколько блоков одного раздела копится до промежуточного слияния
+MERGE_FAN_IN = 8
+
+
+class ChunkSizer:
+    # Стартовый размер: примерно tasks_per_worker порций на каждый исполнитель.
+    # После каждой порции сравниваем накладные расходы (от конца работы
+    # в исполнителе до получения результата родителем) с самой работой:
+    # если расходы больше overhead_ratio от работы - порция удваивается,
+    # если одна порция считается дольше max_task_seconds - уменьшается вдвое.
+    # На хвосте файла порции мельчают, чтобы исполнители финишировали вместе.
+    def __init__(self, total_bytes: int, workers: int,
+                 tasks_per_worker: int = 4,
+                 min_bytes: int = MIN_CHUNK_BYTES,
+                 max_bytes: int = MAX_CHUNK_BYTES,
+                 overhead_ratio: float = 0.05,
+                 max_task_seconds: float = 5.0):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.overhead_ratio = overhead_ratio
+        self.max_task_seconds = max_task_seconds
+        self.size = self._clamp(total_bytes // (workers * tasks_per_worker))
+        self.sizes: List[int] = []
+
+    def _clamp(self, size: int) -> int:
+        return max(self.min_bytes, min(size, self.max_bytes))
+
+    def __call__(self, remaining: int) -> int:
+        size = min(self.size, self._clamp(remaining // (2 * self.workers)))
+        self.sizes.append(size)
+        return size
+
+    def record(self, work_seconds: float, overhead_seconds: float):
+        if overhead_seconds > self.overhead_ratio * work_seconds:
+            self.size = self._clamp(self.size * 2)
+        elif work_seconds > self.max_task_seconds:
+            self.size = self._clamp(self.size // 2)
+
+    def report(self) -> str:
+        sizes_kb = Counter(size // 1024 for size in self.sizes)
+        return ', '.join(f'{count} x {size} КБ' for size, count in sorted(sizes_kb.items()))
+
+
+def byte_ranges(path: str, chunk_bytes: Union[int, Callable[[int], int]],
+                start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    # Прыгаем на chunk_bytes вперед и дочитываем строку до конца,
+    # так каждый диапазон заканчивается ровно на символе перевода строки.
+    # Вместо числа можно передать функцию от оставшегося числа байтов.
+    # start и end (если заданы) должны сами лежать на границах строк.
+    end = os.path.getsize(path) if end is None else end
+    next_size = chunk_bytes if callable(chunk_bytes) else lambda remaining: chunk_bytes
+    with open(path, 'rb') as f:
+        offset = start
+        while offset < end:
+            f.seek(min(offset + next_size(end - offset), end))
+            if f.tell() < end:
+                f.readline()
+            range_end = min(f.tell(), end)
+            yield offset, range_end - offset
+            offset = range_end
+
+
+def is_compressed(path: str) -> bool:
+    return path.endswith('.gz')
+
+
+def data_size(path: str) -> int:
+    # Для .gz - оценка размера распакованных данных по полю ISIZE в конце файла.
+    # Оно хранит размер по модулю 2**32, поэтому для больших файлов
+    # добавляем 4 ГБ, пока оценка меньше самого сжатого файла.
+    size = os.path.getsize(path)
+    if not is_compressed(path):
+        return size
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        estimate = int.from_bytes(f.read(4), 'little')
+    while estimate < size:
+        estimate += 2 ** 32
+    return estimate
+
+
+def input_files(pattern: str) -> List[str]:
+    paths = glob.glob(pattern)
+    if not paths:
+        raise FileNotFoundError(f'Нет файлов по шаблону {pattern}')
+    return sorted(paths, key=data_size, reverse=True)
+
+
+def file_ranges(path: str, chunk_bytes: Union[int, Callable[[int], int]],
+                start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    # Сжатый файл - всегда одна порция (0, размер файла на диске)
+    if not is_compressed(path):
+        yield from byte_ranges(path, chunk_bytes, start, end)
+    elif start == 0:
+        yield 0, os.path.getsize(path)
+
+
+def input_ranges(paths: List[str], chunk_bytes: Union[int, Callable[[int], int]]) -> Iterator[Tuple[str, int, int]]:
+    # Порции всех файлов подряд. Функции выбора размера передается остаток
+    # не одного файла, а всего набора, чтобы порции мельчали только в самом конце.
+    sizes = [data_size(path) for path in paths]
+    for index, path in enumerate(paths):
+        after = sum(sizes[index + 1:])
+        next_size = chunk_bytes
+        if callable(chunk_bytes):
+            def next_size(remaining: int, after: int = after) -> int:
+                return chunk_bytes(remaining + after)
+        for offset, length in file_ranges(path, next_size):
+            yield path, offset, length
+
+
+def read_blocks(path: str, offset: int, length: int) -> Iterator[bytes]:
+    # Обычный файл - один блок из заданного диапазона. Сжатый файл
+    # распаковывается блоками по GZIP_BLOCK_BYTES, выровненными по строкам.
+    if not is_compressed(path):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            yield f.read(length)
+        return
+    with gzip.open(path, 'rb') as f:
+        tail = b''
+        while block := f.read(GZIP_BLOCK_BYTES):
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+            if cut:
+                yield block[:cut]
+        if tail:
+            yield tail
+
+
+def count_lines(data: bytes) -> Dict[str, int]:
+    # Строки разбираются как bytes, декодируется только слово
+    # и только один раз на уникальное слово порции.
+    counter = {}
+    lines = data.splitlines()
+    for line in lines:
+        word, _, count, _ = line.split(b'\t', 3)
+        if word in counter:
+            counter[word] = counter[word] + int(count)
+        else:
+            counter[word] = int(count)
+    report_progress(len(lines), len(data))
+    return {word.decode('utf-8'): count for word, count in counter.items()}
+
+
+def map_range(path: str, offset: int, length: int) -> Dict[str, int]:
+    counter = {}
+    for block in read_blocks(path, offset, length):
+        merge_counters(counter, count_lines(block))
+    return counter
+
+
+# Отображения файлов, открытые в текущем процессе-исполнителе
+_mappings: Dict[str, mmap.mmap] = {}
+
+
+def map_range_mmap(path: str, offset: int, length: int) -> Dict[str, int]:
+    if is_compressed(path):
+        return map_range(path, offset, length)
+    mapping = _mappings.get(path)
+    if mapping is None:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _mappings[path] = mapping
+    # Срез отображения - одно копирование из страничного кэша без системного
+    # вызова read. Разбор построчными mapping.find() прямо по отображению
+    # получается примерно втрое медленнее, чем splitlines() по готовому срезу.
+    return count_lines(mapping[offset:offset + length])
+
+
+def partition_of(key: str, partitions: int) -> int:
+    # crc32, а не hash(): hash строк случаен в каждом процессе, запущенном через spawn
+    return zlib.crc32(key.encode('utf-8')) % partitions
+
+
+def split_counter(counter: Dict[str, int], partitions: int) -> List[Dict[str, int]]:
+    parts = [{} for _ in range(partitions)]
+    for key, value in counter.items():
+        parts[partition_of(key, partitions)][key] = value
+    return parts
+
+
+class PartitionedCounter(Mapping):
+    # Итог слияния по разделам. Ключ ищется в своем разделе по тому же crc32,
+    # поэтому собирать разделы в один словарь родителю не нужно: на больших
+    # словарях такая склейка стоит почти столько же, сколько само слияние.
+    def __init__(self, parts: List[Dict[str, int]]):
+        self.parts = parts
+
+    def __getitem__(self, key: str) -> int:
+        return self.parts[partition_of(key, len(self.parts))][key]
+
+    def __iter__(self) -> Iterator[str]:
+        return itertools.chain.from_iterable(self.parts)
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+
+# Часть раздела: сам словарь или описатель блока разделяемой памяти с ним
+Part = Union[Dict[str, int], SharedCounter]
+
+
+def store_partitions(counter: Dict[str, int], partitions: int, shared_memory: bool = True) -> List[Part]:
+    parts = split_counter(counter, partitions)
+    return [store_shared(part) for part in parts] if shared_memory else parts
+
+
+def load_part(part: Part) -> Dict[str, int]:
+    return load_shared(part) if isinstance(part, SharedCounter) else part
+
+
+def timed_map(map_function: Callable[[str, int, int], Dict[str, int]],
+              path: str, offset: int, length: int,
+              partitions: int, shared_memory: bool = False) -> Tuple[Any, float, float]:
+    # Кроме результата возвращаем длительность работы и момент ее окончания
+    # (time.time сравнимо между процессами), чтобы родитель оценил накладные расходы.
+    # Частичные результаты запросов (queries.TopCandidates) малы и сливаются
+    # своим методом merge в родителе, словари раскладываются по разделам.
+    start = time.perf_counter()
+    partial = map_function(path, offset, length)
+    if not hasattr(partial, 'merge'):
+        partial = store_partitions(partial, partitions, shared_memory)
+    return partial, time.perf_counter() - start, time.time()
+
+
+def merge_counters(first: Dict[str, int], second: Dict[str, int]) -> Dict[str, int]:
+    merged = first
+    for key, value in second.items():
+        if key in merged:
+            merged[key] = merged[key] + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def reduce_partition(parts: List[Part], shared_memory: bool = False) -> Part:
+    merged = {}
+    for part in parts:
+        merge_counters(merged, load_part(part))
+    return store_shared(merged) if shared_memory else merged
+
+
+async def partitioned_reduce(pool: ProcessPoolExecutor,
+                             buckets: List[List[Part]],
+                             shared_memory: bool = False) -> PartitionedCounter:
+    # buckets[i] - части раздела i. Каждый раздел сливается в своем
+    # исполнителе, родитель только получает готовые разделы.
+    # Блоки должны создаваться после start_resource_tracker() в родителе.
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(*[loop.run_in_executor(pool, functools.partial(reduce_partition, list(bucket), shared_memory))
+                                   for bucket in buckets])
+    return PartitionedCounter([load_part(part) for part in parts])
+
+
+def reduce_batch(partials: List[Dict[str, int]], partitions: int, shared_memory: bool = False) -> List[Part]:
+    merged = {}
+    for partial in partials:
+        merge_counters(merged, partial)
+    return store_partitions(merged, partitions, shared_memory)
+
+
+async def batched_reduce(pool: ProcessPoolExecutor,
+                         partials: List[Dict[str, int]],
+                         shared_memory: bool = False) -> PartitionedCounter:
+    # Слияние готового списка частичных словарей (как в 6.4 и 6.5): список
+    # делится на столько пачек, сколько исполнителей, каждая пачка сливается
+    # в исполнителе и раскладывается по разделам, а затем разделы сливаются
+    # как в partitioned_reduce. Частей разделов получается не больше
+    # workers * workers, сколько бы ни было порций.
+    loop = asyncio.get_running_loop()
+    workers = os.cpu_count() or 1
+    size = -(-len(partials) // workers) or 1
+    batches = [partials[start:start + size] for start in range(0, len(partials), size)]
+    results = await asyncio.gather(*[loop.run_in_executor(pool, functools.partial(reduce_batch, batch, workers, shared_memory))
+                                     for batch in batches])
+    return await partitioned_reduce(pool, [list(parts) for parts in zip(*results)], shared_memory)
+
+
+async def map_reduce(path: str = NGRAM_FILE,
+                     chunk_bytes: Optional[int] = None,
+                     max_in_flight: Optional[int] = None,
+                     use_mmap: bool = False,
+                     sizer: Optional[ChunkSizer] = None,
+                     map_function: Optional[Callable[[str, int, int], Dict[str, int]]] = None,
+                     progress: bool = False,
+                     shared_memory: bool = False,
+                     fan_in: int = MERGE_FAN_IN) -> Any:
+    # path - имя файла или шаблон glob для нескольких файлов
+    loop = asyncio.get_running_loop()
+    # Другую реализацию отображения (например, numpy_frequencies.map_range_numpy)
+    # можно передать явно, слияние от этого не меняется.
+    map_function = map_function or (map_range_mmap if use_mmap else map_range)
+    workers = os.cpu_count() or 1
+    # Две порции на ядро: пока одна обрабатывается, вторая уже ждет в очереди.
+    max_in_flight = max_in_flight or 2 * workers
+    paths = input_files(path)
+    total_bytes = sum(data_size(file) for file in paths)
+    if chunk_bytes is None and sizer is None:
+        sizer = ChunkSizer(total_bytes, workers)
+    ranges = input_ranges(paths, sizer or chunk_bytes)
+    buckets: List[List[Part]] = [[] for _ in range(workers)]
+    merged = None
+    pending = set()
+    map_tasks = set()
+    merge_tasks: Dict[asyncio.Future, int] = {}
+    reporter = None
+    pool_options = {}
+    if progress:
+        slots = ProgressSlots()
+        pool_options = {'initializer': init_progress, 'initargs': (slots,)}
+        reporter = asyncio.create_task(progress_reporter(slots, total_bytes=total_bytes))
+    start_resource_tracker()
+
+    with ProcessPoolExecutor(max_workers=workers, **pool_options) as pool:
+        while True:
+            # Набралось fan_in частей одного раздела - исполнитель сливает их
+            # в одну, так число частей не растет с размером файла.
+            for index, bucket in enumerate(buckets):
+                if len(bucket) >= fan_in:
+                    future = loop.run_in_executor(pool, functools.partial(reduce_partition, bucket, shared_memory))
+                    merge_tasks[future] = index
+                    pending.add(future)
+                    buckets[index] = []
+            if len(pending) < max_in_flight:
+                work = next(ranges, None)
+                if work is not None:
+                    future = loop.run_in_executor(pool, functools.partial(timed_map, map_function, *work, workers, shared_memory))
+                    map_tasks.add(future)
+                    pending.add(future)
+                    continue
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            received_at = time.time()
+            for future in done:
+                if future in map_tasks:
+                    map_tasks.discard(future)
+                    partial, work_seconds, finished_at = future.result()
+                    if sizer is not None:
+                        sizer.record(work_seconds, received_at - finished_at)
+                    if hasattr(partial, 'merge'):
+                        merged = partial if merged is None else merged.merge(partial)
+                    else:
+                        for bucket, handle in zip(buckets, partial):
+                            bucket.append(handle)
+                else:
+                    buckets[merge_tasks.pop(future)].append(future.result())
+        if merged is None:
+            merged = await partitioned_reduce(pool, buckets, shared_memory)
+
+    if reporter is not None:
+        reporter.cancel()
+    if sizer is not None:
+        print(f'Размеры порций: {sizer.report()}')
+    return merged
+
+
+async def benchmark_transport(path: str = NGRAM_FILE):
+    # Процессорное время родителя (включая служебные потоки пула, которые
+    # сериализуют и десериализуют части разделов), когда части передаются
+    # словарями через pickle и описателями блоков разделяемой памяти
+    for shared_memory in (False, True):
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        await map_reduce(path, shared_memory=shared_memory)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        print(f'shared_memory={shared_memory}: процессор родителя {cpu:.4f} с, всего {wall:.4f} с')
+
+
+async def main(path: str = NGRAM_FILE, chunk_bytes: Optional[int] = None):
+    start = time.time()
+    final_result = await map_reduce(path, chunk_bytes)
+    print(f"Aardvark встречается {final_result['Aardvark']} раз.")
+    end = time.time()
+    print(f'Время потокового MapReduce: {(end - start):.4f} секунд')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# Векторизованный подсчет частот с NumPy
+#
+# Горячая точка задачи о n-граммах - цикл по строкам в map_frequencies:
+# line.split('\t'), int(count) и обновление словаря для каждой строки.
+# Здесь порция разбирается целиком в столбцы:
+#   - позиции табуляций и переводов строк ищутся одной операцией над массивом байтов;
+#   - поле count переводится в int64 без Python-цикла (цифры умножаются
+#     на степени десяти и суммируются через np.add.reduceat);
+#   - слова порции получают идентификаторы в локальном словаре (np.unique),
+#     после чего счетчики группируются сортировкой и np.add.reduceat.
+# Результат - обычный словарь, поэтому слияние остается прежним (merge_counters).
+#
+# Слова копируются в матрицу ширины самого длинного слова порции, так что
+# памяти нужно примерно (число строк) x (длина самого длинного слова) байт.
+
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+from mapreduce import NGRAM_FILE, byte_ranges, map_range, merge_counters, read_blocks
+from progress import report_progress
+
+
+NEWLINE = ord('\n')
+
+TAB = ord('\t')
+
+ZERO = ord('0')
+
+
+def field_indexes(starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Индексы всех байтов всех полей подряд и номер байта внутри своего поля
+    field_offsets = np.cumsum(lengths) - lengths
+    within = np.arange(lengths.sum()) - np.repeat(field_offsets, lengths)
+    return np.repeat(starts, lengths) + within, within
+
+
+def count_lines_numpy(data: bytes) -> Dict[str, int]:
+    if not data:
+        return {}
+    if not data.endswith(b'\n'):
+        data = data + b'\n'
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    line_ends = np.flatnonzero(buffer == NEWLINE)
+    tabs = np.flatnonzero(buffer == TAB)
+    if len(tabs) != 3 * len(line_ends):
+        raise ValueError('Ожидается ровно 4 поля, разделенных табуляцией, в каждой строке')
+    tabs = tabs.reshape(-1, 3)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+    # Столбец count: байты между второй и третьей табуляцией
+    count_starts = tabs[:, 1] + 1
+    count_lengths = tabs[:, 2] - count_starts
+    indexes, within = field_indexes(count_starts, count_lengths)
+    digits = (buffer[indexes] - ZERO).astype(np.int64)
+    powers = np.power(10, np.repeat(count_lengths, count_lengths) - 1 - within).astype(np.int64)
+    counts = np.add.reduceat(digits * powers, np.cumsum(count_lengths) - count_lengths)
+
+    # Столбец word: байты от начала строки до первой табуляции,
+    # выровненные нулями до общей ширины и просмотренные как массив bytes
+    word_lengths = tabs[:, 0] - line_starts
+    width = int(word_lengths.max())
+    matrix = np.zeros((len(line_starts), width), dtype=np.uint8)
+    indexes, within = field_indexes(line_starts, word_lengths)
+    matrix[np.repeat(np.arange(len(line_starts)), word_lengths), within] = buffer[indexes]
+    words = matrix.view(f'S{width}').ravel()
+
+    # Группировка: локальный словарь порции, сортировка по id и сумма по группам
+    vocabulary, word_ids = np.unique(words, return_inverse=True)
+    order = np.argsort(word_ids, kind='stable')
+    sorted_ids = word_ids[order]
+    group_starts = np.flatnonzero(np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1])))
+    totals = np.add.reduceat(counts[order], group_starts)
+    report_progress(len(line_starts), len(data))
+
+    return {word.decode('utf-8'): int(total) for word, total in zip(vocabulary, totals)}
+
+
+def map_range_numpy(path: str, offset: int, length: int) -> Dict[str, int]:
+    counter = {}
+    for block in read_blocks(path, offset, length):
+        merge_counters(counter, count_lines_numpy(block))
+    return counter
+
+
+def benchmark(path: str = NGRAM_FILE, chunk_bytes: int = 16 * 1024 * 1024):
+    # Обе реализации в одном процессе на одних и тех же диапазонах файла
+    results = []
+    for name, map_function in (('dict', map_range), ('numpy', map_range_numpy)):
+        start = time.perf_counter()
+        result = {}
+        for offset, length in byte_ranges(path, chunk_bytes):
+            merge_counters(result, map_function(path, offset, length))
+        end = time.perf_counter()
+        print(f'{name}: {(end - start):.4f} секунд')
+        results.append(result)
+    assert results[0] == results[1]
+
+
+# Распараллеленный вариант:
+#     asyncio.run(mapreduce.map_reduce(map_function=map_range_numpy))
+
+if __name__ == "__main__":
+    benchmark()
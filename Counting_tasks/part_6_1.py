@@ -254,6 +254,30 @@ async def main_as_completed():
 
 if __name__ == "__main__":
     asyncio.run(main_as_completed())
+
+
+# От себя. Выбор исполнителя
+
+# Пул процессов здесь создается прямо в main. В модуле executors это
+# вынесено в run_cpu(fn, *args): исполнитель (процессы, потоки для сборки
+# без GIL или субинтерпретаторы) выбирается через executors.configure
+# или переменную окружения CPU_BACKEND, а код вызова остается прежним.
+
+async def main_run_cpu():
+    from executors import run_cpu, shutdown
+
+    nums = [1000, 1, 3, 5, 22, 100000000]
+    try:
+        results = await asyncio.gather(*[run_cpu(count, num) for num in nums])
+    finally:
+        shutdown()
+
+    for result in results:
+        print(result)
+
+
+# if __name__ == "__main__":
+#     asyncio.run(main_run_cpu())
 # ===============================================================================
 
 # Далее к изучению 
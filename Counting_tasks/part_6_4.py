@@ -130,6 +130,9 @@ import functools
 import time
 from typing import Dict, List
 
+from mapreduce import batched_reduce
+from shared_counters import start_resource_tracker
+
 
 def partition(data: List, chunk_size: int):
     for i in range(0, len(data), chunk_size):
@@ -164,12 +167,19 @@ async def main(partition_size: int):
         tasks = []
         start = time.time()
 
+        # От себя: functools.reduce(merge_dictionaries, ...) в родительском
+        # процессе однопоточный и при сотнях частичных словарей становится
+        # узким местом. Поэтому словари сливаются в пуле: пачками по числу
+        # исполнителей, затем по разделам ключей, а родитель получает только
+        # готовые разделы (см. mapreduce.batched_reduce). Части разделов
+        # передаются через разделяемую память, и их не больше cpu_count ** 2.
+        start_resource_tracker()
         with concurrent.futures.ProcessPoolExecutor() as pool:
             for chunk in partition(contents, partition_size):
                 tasks.append(loop.run_in_executor(pool, functools.partial(map_frequencies, chunk)))
             print('Задачи созданы')
             intermediate_results = await asyncio.gather(*tasks)
-            final_result = functools.reduce(merge_dictionaries, intermediate_results)
+            final_result = await batched_reduce(pool, intermediate_results, shared_memory=True)
 
             print(f"Aardvark встречается {final_result['Aardvark']} раз.")
             end = time.time()
@@ -193,6 +203,22 @@ if __name__ == "__main__":
 # нам в полной мере задействовать возможности компьютера. 
 # Например, если имеется 10 ядер, но всего две порции, то мы ничем не загружаем 
 # восемь ядер, которые могли бы работать параллельно.
+# ==================================================================
+# ==================================================================
+# От себя. Потоковый вариант
+
+# У main выше есть и другая проблема: readlines() загружает в память
+# весь файл, а каждая порция строк еще раз копируется при сериализации.
+# В модуле mapreduce файл делится на диапазоны байтов, выровненные по
+# границам строк, исполнитель получает только (смещение, длина) и читает
+# свой кусок сам, а в работе одновременно держится ограниченное число порций.
+
+# Путь можно задать шаблоном glob - тогда все буквы корпуса, включая
+# сжатые .gz файлы, обрабатываются одним пулом и сливаются в один результат.
+
+# if __name__ == "__main__":
+#     from mapreduce import main as main_streaming
+#     asyncio.run(main_streaming('Counting_tasks/googlebooks-eng-all-1gram-20120701-*'))
 
 
 # далее к изучению:
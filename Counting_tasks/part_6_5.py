@@ -185,7 +185,9 @@ import functools
 import asyncio
 from multiprocessing import Value
 from typing import List, Dict
-from part_6_4 import partition, merge_dictionaries
+from part_6_4 import partition
+from mapreduce import batched_reduce
+from shared_counters import start_resource_tracker
 
 
 map_progress: Value # type: ignore
@@ -227,6 +229,7 @@ async def main(partiton_size: int):
         tasks = []
         map_progress = Value('i', 0)
 
+        start_resource_tracker()
         with ProcessPoolExecutor(initializer=init, initargs=(map_progress,)) as pool:
             total_partitions = len(contents) // partiton_size
             reporter = asyncio.create_task(progress_reporter(total_partitions))
@@ -234,14 +237,67 @@ async def main(partiton_size: int):
             for chunk in partition(contents, partiton_size):
                 tasks.append(loop.run_in_executor(pool, functools.partial(map_frequencies, chunk)))
 
-        counters = await asyncio.gather(*tasks)
-        await reporter
-        final_result = functools.reduce(merge_dictionaries, counters)
+            counters = await asyncio.gather(*tasks)
+            await reporter
+            # Слияние пачками и по разделам в пуле (см. mapreduce.batched_reduce)
+            final_result = await batched_reduce(pool, counters, shared_memory=True)
         print(f"Aardvark встречается {final_result['Aardvark']} раз.")
 
 # if __name__ == "__main__":
 #     asyncio.run(main(partiton_size=60000))
 
+# ==================================================================
+# ==================================================================
+# От себя. Прогресс без блокировки
+
+# При маленьких порциях блокировка map_progress захватывается очень часто,
+# и исполнители начинают ждать друг друга. В модуле progress у каждого
+# исполнителя своя ячейка разделяемого массива: пишет в нее только он,
+# а репортер складывает ячейки и заодно считает скорость и оставшееся время.
+
+# progress_reporter из модуля progress импортируется под другим именем:
+# одноименная функция выше нужна main
+from progress import ProgressSlots, init_progress, report_progress
+from progress import progress_reporter as slots_reporter
+
+
+def map_frequencies_lock_free(chunk: List[str]) -> Dict[str, int]:
+    counter = {}
+    for line in chunk:
+        word, _, count, _ = line.split('\t')
+        if counter.get(word):
+            counter[word] = counter[word] + int(count)
+        else:
+            counter[word] = int(count)
+
+    # Строки уже декодированы в str, байты считаем по UTF-8, как в исходном файле
+    report_progress(len(chunk), sum(len(line.encode('utf-8')) for line in chunk))
+
+    return counter
+
+
+async def main_lock_free(partiton_size: int):
+    with open('googlebooks-eng-all-1gram-20120701-a', encoding='utf-8') as f:
+        contents = f.readlines()
+        loop = asyncio.get_running_loop()
+        tasks = []
+        progress = ProgressSlots()
+
+        start_resource_tracker()
+        with ProcessPoolExecutor(initializer=init_progress, initargs=(progress,)) as pool:
+            reporter = asyncio.create_task(slots_reporter(progress, total_lines=len(contents)))
+
+            for chunk in partition(contents, partiton_size):
+                tasks.append(loop.run_in_executor(pool, functools.partial(map_frequencies_lock_free, chunk)))
+
+            counters = await asyncio.gather(*tasks)
+            await reporter
+            final_result = await batched_reduce(pool, counters, shared_memory=True)
+        print(f"Aardvark встречается {final_result['Aardvark']} раз.")
+
+# if __name__ == "__main__":
+#     asyncio.run(main_lock_free(partiton_size=60000))
+
 
 
 # далее к изучению:
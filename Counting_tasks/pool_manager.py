@@ -0,0 +1,191 @@
+# Долгоживущий "прогретый" пул процессов для цикла событий
+#
+# Все примеры в Counting_tasks создают ProcessPoolExecutor() внутри with
+# и закрывают его в конце, каждый раз платя за запуск процессов и импорт
+# модулей. ProcessPoolManager держит один пул на весь цикл событий:
+#   - процессы запускаются заранее (start), а initializer сразу импортирует
+#     модули из preload, так что первый run_in_executor уже ничего не ждет;
+#   - health_check отправляет в пул пустую задачу и пересоздает пул,
+#     если тот сломан (BrokenProcessPool) или не отвечает; процессы старого
+#     пула при этом убиваются, иначе зависший исполнитель остался бы жить;
+#   - max_tasks_per_child перезапускает исполнитель после N задач
+#     (защита от утечек памяти в долгоживущем сервисе);
+#   - shutdown закрывает пул, а run() делает это автоматически при выходе
+#     из main, как asyncio.run закрывает цикл событий.
+#
+# Менеджер привязан к циклу событий: get_pool_manager() в любой сопрограмме
+# вернет один и тот же пул, пока цикл жив.
+
+import asyncio
+import atexit
+import functools
+import importlib
+import os
+import time
+import weakref
+from asyncio import AbstractEventLoop
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Coroutine, Optional, Sequence
+
+
+def _init_worker(preload: Sequence[str], initializer: Optional[Callable], initargs: tuple):
+    for module in preload:
+        importlib.import_module(module)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _warm_up(delay: float) -> int:
+    # Задача держит исполнитель занятым, пока пул не запустит остальные
+    time.sleep(delay)
+    return os.getpid()
+
+
+class ProcessPoolManager:
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 preload: Sequence[str] = (),
+                 max_tasks_per_child: Optional[int] = None,
+                 initializer: Optional[Callable] = None,
+                 initargs: tuple = ()):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.preload = tuple(preload)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _create(self) -> ProcessPoolExecutor:
+        options = {}
+        if self.max_tasks_per_child is not None:
+            # В 3.11 для max_tasks_per_child пул сам выбирает метод запуска spawn
+            options['max_tasks_per_child'] = self.max_tasks_per_child
+        return ProcessPoolExecutor(max_workers=self.max_workers,
+                                   initializer=_init_worker,
+                                   initargs=(self.preload, self.initializer, self.initargs),
+                                   **options)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            raise RuntimeError('Пул не запущен, сначала вызовите start()')
+        return self._pool
+
+    async def start(self, warm_up_delay: float = 0.05):
+        if self._pool is None:
+            self._pool = self._create()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self._pool, _warm_up, warm_up_delay)
+                                      for _ in range(self.max_workers)])
+        print(f'Пул процессов прогрет, исполнителей: {len(set(pids))}')
+
+    async def health_check(self, timeout: float = 5.0) -> bool:
+        # True - пул исправен; False - пул был сломан и пересоздан
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            await asyncio.wait_for(loop.run_in_executor(pool, os.getpid), timeout)
+            return True
+        except (BrokenProcessPool, asyncio.TimeoutError):
+            await self.restart(pool)
+            return False
+
+    async def restart(self, failed: Optional[ProcessPoolExecutor] = None):
+        # failed - пул, в котором случилась ошибка. Если его уже заменили
+        # (например, задачи убитого пула тоже получили BrokenProcessPool),
+        # новый пул не трогаем.
+        if failed is not None and failed is not self._pool:
+            return
+        if self._pool is not None:
+            self._kill(self._pool)
+        self._pool = None
+        await self.start()
+
+    @staticmethod
+    def _kill(pool: ProcessPoolExecutor):
+        # shutdown(wait=False) не останавливает исполнитель, зависший в задаче:
+        # процесс продолжит занимать ядро, а выход интерпретатора будет ждать
+        # служебный поток старого пула. Поэтому процессы старого пула убиваем
+        # сами (_processes - внутренний атрибут, открытого способа нет).
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.join()
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            return await loop.run_in_executor(pool, functools.partial(fn, *args))
+        except BrokenProcessPool:
+            # Задачу не повторяем (она могла и уронить пул), но следующие
+            # вызовы получат уже новый пул
+            await self.restart(pool)
+            raise
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_managers: 'weakref.WeakKeyDictionary[AbstractEventLoop, ProcessPoolManager]' = weakref.WeakKeyDictionary()
+
+
+def current_manager() -> Optional[ProcessPoolManager]:
+    try:
+        return _managers.get(asyncio.get_running_loop())
+    except RuntimeError:
+        return None
+
+
+async def get_pool_manager(**options: Any) -> ProcessPoolManager:
+    # options учитываются только при первом вызове в данном цикле событий
+    loop = asyncio.get_running_loop()
+    manager = _managers.get(loop)
+    if manager is None:
+        manager = ProcessPoolManager(**options)
+        _managers[loop] = manager
+        await manager.start()
+    return manager
+
+
+@atexit.register
+def _shutdown_all():
+    # Страховка для циклов, закрытых без run(): пул не должен пережить интерпретатор
+    for manager in list(_managers.values()):
+        manager.shutdown(wait=False)
+
+
+def run(main: Coroutine, **options: Any) -> Any:
+    # Аналог asyncio.run: пул запускается до main и закрывается после нее
+    async def runner():
+        manager = await get_pool_manager(**options)
+        try:
+            return await main
+        finally:
+            manager.shutdown()
+            _managers.pop(asyncio.get_running_loop(), None)
+
+    return asyncio.run(runner())
+
+
+# ==================================================================
+# Повторные вызовы count через прогретый пул
+
+async def main():
+    from part_6_1 import count
+
+    manager = await get_pool_manager()
+    for attempt in range(3):
+        start = time.perf_counter()
+        results = await asyncio.gather(*[manager.run(count, num) for num in [1, 3, 5, 22, 1000]])
+        print(f'Попытка {attempt}: {results} за {time.perf_counter() - start:.4f} с')
+    print(f'Пул исправен: {await manager.health_check()}')
+
+
+if __name__ == "__main__":
+    run(main(), preload=['part_6_1'], max_tasks_per_child=1000)
@@ -0,0 +1,79 @@
+# Прогресс пула процессов без блокировок
+#
+# В part_6_5 каждый исполнитель после каждой порции захватывает блокировку
+# разделяемого Value, и при мелких порциях за нее постоянно идет борьба.
+# Здесь у каждого процесса-исполнителя своя ячейка в разделяемых массивах
+# (Array с lock=False): пишет в ячейку только ее владелец, поэтому блокировка
+# не нужна. Репортер в родительском процессе складывает ячейки и печатает
+# пропускную способность (строк/с, байт/с) и оценку оставшегося времени.
+#
+# Номер ячейки процесс получает один раз в инициализаторе пула - только там
+# используется блокировка (shared_primitives.SlotAllocator: пересоздаваемые
+# пулом процессы занимают ячейки завершившихся, с живыми ячейку не делят).
+
+import asyncio
+import time
+from multiprocessing import Array
+from typing import Optional
+
+from shared_primitives import SlotAllocator
+
+
+class ProgressSlots:
+    def __init__(self, slots: Optional[int] = None):
+        self.allocator = SlotAllocator(slots)
+        self.lines = Array('q', self.allocator.slots, lock=False)
+        self.bytes = Array('q', self.allocator.slots, lock=False)
+
+    def totals(self):
+        return sum(self.lines), sum(self.bytes)
+
+
+_progress: Optional[ProgressSlots] = None
+
+_slot = 0
+
+
+def init_progress(progress: ProgressSlots):
+    global _progress, _slot
+    _progress = progress
+    _slot = progress.allocator.slot()
+
+
+def report_progress(lines: int, n_bytes: int):
+    # В процессе без init_progress (например, в синхронном тесте) ничего не делаем
+    if _progress is None:
+        return
+    _progress.lines[_slot] += lines
+    _progress.bytes[_slot] += n_bytes
+
+
+def format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:d}:{minutes:02d}:{seconds:02d}'
+
+
+async def progress_reporter(progress: ProgressSlots,
+                            total_bytes: Optional[int] = None,
+                            total_lines: Optional[int] = None,
+                            interval: float = 1.0):
+    # Оценка оставшегося времени строится по байтам, если известен их
+    # общий объем, иначе по строкам. Завершается сам, когда все обработано,
+    # или снимается вызывающей стороной.
+    start = time.perf_counter()
+    while True:
+        await asyncio.sleep(interval)
+        lines, n_bytes = progress.totals()
+        elapsed = time.perf_counter() - start
+        lines_rate = lines / elapsed
+        bytes_rate = n_bytes / elapsed
+        message = f'Обработано {lines} строк, {n_bytes / 2 ** 20:.1f} МБ ' \
+                  f'({lines_rate:.0f} строк/с, {bytes_rate / 2 ** 20:.1f} МБ/с)'
+        if total_bytes and bytes_rate:
+            message += f', осталось ~{format_eta((total_bytes - n_bytes) / bytes_rate)}'
+        elif total_lines and lines_rate:
+            message += f', осталось ~{format_eta((total_lines - lines) / lines_rate)}'
+        print(message)
+        if (total_bytes and n_bytes >= total_bytes) or (total_lines and lines >= total_lines):
+            return
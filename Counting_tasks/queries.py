@@ -0,0 +1,109 @@
+# Запросы к частотам слов без построения полного словаря
+#
+# В part_6_4 строится словарь по всему словарному запасу только ради того,
+# чтобы напечатать final_result['Aardvark']. Здесь фильтр запроса
+# применяется уже на этапе отображения: исполнитель считает только
+# подходящие строки (точный набор слов, префикс, диапазон годов - тот самый
+# неиспользуемый столбец в line.split('\t')), и в родителя попадают
+# только они.
+#
+# Для top-K исполнитель возвращает не словарь, а K лучших слов своей порции
+# (TopCandidates), которые сливаются через heapq.nlargest. Здесь используется
+# то, что файлы n-грамм отсортированы по слову: все строки слова идут подряд,
+# поэтому целиком в порцию не попасть могут только первое и последнее слово.
+# Их счетчики хранятся отдельно (edges) и суммируются при слиянии.
+
+import asyncio
+import functools
+import heapq
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple, Union
+
+from mapreduce import NGRAM_FILE, map_reduce, merge_counters, read_blocks
+from progress import report_progress
+
+
+class Query(NamedTuple):
+    words: Optional[FrozenSet[str]] = None
+    prefix: Optional[str] = None
+    years: Optional[Tuple[int, int]] = None  # включительно
+    top_k: Optional[int] = None
+
+
+class TopCandidates(NamedTuple):
+    k: int
+    top: List[Tuple[int, str]]
+    edges: Dict[str, int]
+
+    def merge(self, other: 'TopCandidates') -> 'TopCandidates':
+        edges = merge_counters(dict(self.edges), other.edges)
+        return TopCandidates(self.k, heapq.nlargest(self.k, self.top + other.top), edges)
+
+    def result(self) -> List[Tuple[str, int]]:
+        candidates = self.top + [(count, word) for word, count in self.edges.items()]
+        return [(word, count) for count, word in heapq.nlargest(self.k, candidates)]
+
+
+def map_query(query: Query, path: str, offset: int, length: int) -> Union[Dict[str, int], TopCandidates]:
+    words = {word.encode('utf-8') for word in query.words} if query.words is not None else None
+    prefix = query.prefix.encode('utf-8') if query.prefix is not None else None
+    counter = {}
+    first_line = last_line = None
+    for block in read_blocks(path, offset, length):
+        lines = block.splitlines()
+        if not lines:
+            continue
+        if first_line is None:
+            first_line = lines[0]
+        last_line = lines[-1]
+        for line in lines:
+            word, year, count, _ = line.split(b'\t', 3)
+            if words is not None and word not in words:
+                continue
+            if prefix is not None and not word.startswith(prefix):
+                continue
+            if query.years is not None and not query.years[0] <= int(year) <= query.years[1]:
+                continue
+            if word in counter:
+                counter[word] = counter[word] + int(count)
+            else:
+                counter[word] = int(count)
+        report_progress(len(lines), len(block))
+
+    counter = {word.decode('utf-8'): count for word, count in counter.items()}
+    if query.top_k is None:
+        return counter
+
+    edges = {}
+    for line in {first_line, last_line} - {None}:
+        word = line.split(b'\t', 1)[0].decode('utf-8')
+        if word in counter:
+            edges[word] = counter.pop(word)
+    top = heapq.nlargest(query.top_k, ((count, word) for word, count in counter.items()))
+    return TopCandidates(query.top_k, top, edges)
+
+
+async def run_query(query: Query,
+                    path: str = NGRAM_FILE,
+                    chunk_bytes: Optional[int] = None,
+                    progress: bool = False) -> Union[Dict[str, int], List[Tuple[str, int]]]:
+    # Движок тот же, что и у полного подсчета (mapreduce.map_reduce), меняется
+    # только функция отображения. TopCandidates сливаются своим методом merge.
+    result = await map_reduce(path, chunk_bytes=chunk_bytes, progress=progress,
+                              map_function=functools.partial(map_query, query))
+    if query.top_k is None:
+        # Отобранных слов немного, разделы можно собрать в обычный словарь
+        return dict(result)
+    return result.result() if isinstance(result, TopCandidates) else []
+
+
+async def main(path: str = NGRAM_FILE):
+    found = await run_query(Query(words=frozenset({'Aardvark', 'Abacus'})), path)
+    print(f'Точный поиск: {found}')
+    print(f'10 самых частых слов: {await run_query(Query(top_k=10), path)}')
+    print(f"5 самых частых слов на 'Aard': {await run_query(Query(prefix='Aard', top_k=5), path)}")
+    found = await run_query(Query(words=frozenset({'Aardvark'}), years=(2000, 2008)), path)
+    print(f'Aardvark в 2000-2008 годах: {found}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# Передача частичных счетчиков через разделяемую память
+#
+# Обычно исполнитель возвращает Dict[str, int], и словарь целиком
+# сериализуется (pickle) по пути в родительский процесс, а там
+# десериализуется. Для больших частичных результатов это заметная работа
+# родителя. Здесь исполнитель сам кладет счетчик в блок
+# multiprocessing.shared_memory в компактном виде и возвращает только
+# описатель блока (имя и размер), а читает блок тот, кому он нужен, -
+# исполнитель слияния или родитель.
+#
+# Формат блока:
+#   n_keys, keys_len  - два int64;
+#   counts            - n_keys значений int64;
+#   keys              - слова в UTF-8, разделенные '\n' (в словах его не бывает,
+#                       файл уже разбит по строкам), декодируются одним вызовом.
+
+import struct
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, NamedTuple
+
+
+HEADER = struct.Struct('qq')
+
+
+class SharedCounter(NamedTuple):
+    name: str
+    size: int
+
+
+def pack_counter(counter: Dict[str, int]) -> bytes:
+    keys = '\n'.join(counter).encode('utf-8')
+    counts = array('q', counter.values())
+    return HEADER.pack(len(counts), len(keys)) + counts.tobytes() + keys
+
+
+def read_counter(buffer) -> Dict[str, int]:
+    n_keys, keys_len = HEADER.unpack_from(buffer, 0)
+    if n_keys == 0:
+        return {}
+    counts_end = HEADER.size + 8 * n_keys
+    counts = array('q')
+    counts.frombytes(buffer[HEADER.size:counts_end])
+    keys = bytes(buffer[counts_end:counts_end + keys_len]).decode('utf-8').split('\n')
+    return dict(zip(keys, counts))
+
+
+def start_resource_tracker():
+    # Вызывается в родителе до создания пула. Иначе каждый исполнитель
+    # запустит собственный resource_tracker, и тот при завершении исполнителя
+    # удалит созданные им блоки, которые родитель еще не успел прочитать.
+    resource_tracker.ensure_running()
+
+
+def store_shared(counter: Dict[str, int]) -> SharedCounter:
+    packed = pack_counter(counter)
+    # Блок нулевого размера создать нельзя, пустой счетчик - это только заголовок
+    block = shared_memory.SharedMemory(create=True, size=len(packed))
+    block.buf[:len(packed)] = packed
+    handle = SharedCounter(block.name, len(packed))
+    block.close()
+    return handle
+
+
+def load_shared(handle: SharedCounter) -> Dict[str, int]:
+    # Блок читается ровно один раз, поэтому сразу и освобождается
+    block = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return read_counter(block.buf[:handle.size])
+    finally:
+        block.close()
+        block.unlink()
@@ -0,0 +1,203 @@
+# Примитивы разделяемой памяти с пакетными обновлениями
+#
+# В part_6_5 каждое увеличение Value идет под get_lock(), а increment_array
+# обходит массив поэлементно. Под нагрузкой из N процессов блокировка
+# превращает параллельный код в последовательный. Здесь:
+#   - SlotAllocator - раздача ячеек разделяемых массивов по одной на живой
+#     процесс (им же пользуется progress.ProgressSlots);
+#   - ShardedCounter - счетчик из ячеек по одной на процесс: процесс пишет
+#     только в свою ячейку без блокировки, значение - сумма ячеек при чтении;
+#   - BatchedAdder - копит приращения локально и сбрасывает их в счетчик
+#     раз в batch прибавлений (значение видно другим процессам с запаздыванием
+#     не больше batch, зато обращений к разделяемой памяти в batch раз меньше);
+#   - SharedNDArray - массив NumPy поверх multiprocessing.shared_memory:
+#     векторные операции вместо поэлементного цикла, а в дочерний процесс
+#     передается только имя блока.
+
+import os
+import time
+from multiprocessing import Array, Process, Value, shared_memory
+from typing import Optional, Sequence
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill(pid, 0) в Windows завершает процесс, а не проверяет его
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SlotAllocator:
+    # Ячейка закреплена за pid владельца. Новый процесс берет свободную ячейку
+    # или ячейку завершившегося процесса (накопленное там значение остается
+    # в сумме), а если все ячейки заняты живыми процессами - RuntimeError:
+    # две живые записи без блокировки в одну ячейку теряли бы приращения.
+    def __init__(self, slots: Optional[int] = None):
+        self.slots = slots or 4 * (os.cpu_count() or 1)
+        self._owners = Array('q', self.slots)
+        self._slot = 0
+        self._pid: Optional[int] = None
+
+    def _claim(self, pid: int) -> int:
+        with self._owners.get_lock():
+            owners = self._owners.get_obj()
+            owners_now = list(owners)
+            # Ячейка могла остаться за этим pid от завершившегося процесса
+            if pid in owners_now:
+                return owners_now.index(pid)
+            for index, owner in enumerate(owners_now):
+                if owner == 0 or not _process_alive(owner):
+                    owners[index] = pid
+                    return index
+        raise RuntimeError(f'Все {self.slots} ячеек заняты живыми процессами, '
+                           f'увеличьте число ячеек (slots)')
+
+    def slot(self) -> int:
+        # После fork объект в дочернем процессе - копия родительского,
+        # поэтому ячейку заново берет каждый новый процесс
+        pid = os.getpid()
+        if self._pid != pid:
+            self._slot = self._claim(pid)
+            self._pid = pid
+        return self._slot
+
+
+class ShardedCounter:
+    def __init__(self, slots: Optional[int] = None):
+        self.allocator = SlotAllocator(slots)
+        self.cells = Array('q', self.allocator.slots, lock=False)
+
+    def add(self, amount: int = 1):
+        self.cells[self.allocator.slot()] += amount
+
+    @property
+    def value(self) -> int:
+        return sum(self.cells)
+
+
+class BatchedAdder:
+    def __init__(self, counter: ShardedCounter, batch: int = 1000):
+        self.counter = counter
+        self.batch = batch
+        self.pending = 0
+
+    def add(self, amount: int = 1):
+        self.pending += amount
+        if self.pending >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.counter.add(self.pending)
+            self.pending = 0
+
+    def __enter__(self) -> 'BatchedAdder':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+class SharedNDArray:
+    # Создатель (name=None) владеет блоком и удаляет его в close();
+    # в других процессах объект восстанавливается по имени блока.
+    def __init__(self, shape: Sequence[int], dtype: str = 'int64', name: Optional[str] = None):
+        import numpy as np
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._owner = name is None
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self._block = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._block.buf)
+        if self._owner:
+            self.array.fill(0)
+
+    def __reduce__(self):
+        return SharedNDArray, (self.shape, self.dtype.str, self._block.name)
+
+    def close(self):
+        del self.array
+        self._block.close()
+        if self._owner:
+            self._block.unlink()
+
+
+# ==================================================================
+# Сравнение с increment_value из part_6_5 (Value под блокировкой)
+
+def increment_locked(shared_int: Value, increments: int):  # type: ignore
+    from part_6_5 import increment_value
+
+    for _ in range(increments):
+        increment_value(shared_int)
+
+
+def increment_sharded(counter: ShardedCounter, increments: int):
+    for _ in range(increments):
+        counter.add()
+
+
+def increment_batched(counter: ShardedCounter, increments: int):
+    with BatchedAdder(counter) as adder:
+        for _ in range(increments):
+            adder.add()
+
+
+def increment_array_rows(shared_array: Array, row: int, width: int, rounds: int):  # type: ignore
+    # Как increment_array из part_6_5: поэлементный цикл, но по своей строке
+    for _ in range(rounds):
+        for index in range(row * width, (row + 1) * width):
+            shared_array[index] = shared_array[index] + 1
+
+
+def increment_shared_rows(shared: SharedNDArray, row: int, width: int, rounds: int):
+    # То же одной векторной операцией на проход. Каждый процесс пишет
+    # в свою строку, поэтому гонки нет и блокировка не нужна.
+    for _ in range(rounds):
+        shared.array[row] += 1
+
+
+def benchmark(processes: int = 4, increments: int = 200_000):
+    variants = [
+        ('Value + get_lock', increment_locked, Value('i', 0)),
+        ('ShardedCounter', increment_sharded, ShardedCounter()),
+        ('ShardedCounter + BatchedAdder', increment_batched, ShardedCounter()),
+    ]
+    for name, target, shared in variants:
+        procs = [Process(target=target, args=(shared, increments)) for _ in range(processes)]
+        start = time.perf_counter()
+        [p.start() for p in procs]
+        [p.join() for p in procs]
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {shared.value} за {elapsed:.4f} с')
+        assert shared.value == processes * increments
+
+
+def benchmark_array(processes: int = 4, width: int = 10_000, rounds: int = 100):
+    shared_array = Array('q', processes * width, lock=False)
+    shared = SharedNDArray((processes, width))
+    variants = [
+        ('Array, поэлементно', increment_array_rows, shared_array, lambda: sum(shared_array)),
+        ('SharedNDArray, векторно', increment_shared_rows, shared, lambda: int(shared.array.sum())),
+    ]
+    for name, target, data, total in variants:
+        procs = [Process(target=target, args=(data, row, width, rounds)) for row in range(processes)]
+        start = time.perf_counter()
+        [p.start() for p in procs]
+        [p.join() for p in procs]
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {total()} за {elapsed:.4f} с')
+        assert total() == processes * width * rounds
+    shared.close()
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_array()
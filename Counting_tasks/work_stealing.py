@@ -0,0 +1,112 @@
+# Планировщик с перехватом работы (work stealing) для перекошенных заданий
+#
+# В main_gather из part_6_1 подается [1000, 1, 3, 5, 22, 100000000]:
+# одно задание в миллионы раз больше остальных, и пока один исполнитель
+# считает до 1e8, остальные простаивают. Если задание делимое (count до N -
+# это count на полуинтервалах, сумма которых дает N), его можно резать.
+#
+# У каждого исполнителя своя очередь (deque) диапазонов. Исполнитель берет
+# из головы своей очереди кусок не больше grain, остаток возвращает обратно.
+# Опустев, исполнитель перехватывает работу у самого загруженного соседа:
+# забирает с хвоста его очереди диапазон, а если тот большой - вторую половину.
+# Частичные результаты одного задания объединяются функцией combine.
+# Вся бухгалтерия очередей живет в цикле событий, поэтому блокировки не нужны.
+
+import asyncio
+import operator
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, NamedTuple, Optional, Tuple
+
+from executors import run_cpu, shutdown
+
+
+class DivisibleJob(NamedTuple):
+    fn: Callable[[int, int], Any]
+    start: int
+    stop: int
+    combine: Callable[[Any, Any], Any] = operator.add
+
+
+def count_range(start: int, stop: int) -> int:
+    # count из part_6_1 на полуинтервале [start, stop): count(n) == count_range(0, n)
+    counter = start
+    while counter < stop:
+        counter = counter + 1
+    return counter - start
+
+
+Piece = Tuple[int, int, int]  # номер задания, начало, конец
+
+
+class WorkStealingScheduler:
+    def __init__(self, workers: Optional[int] = None, grain: int = 1_000_000):
+        self.workers = workers or os.cpu_count() or 1
+        self.grain = grain
+        self.queues: List[Deque[Piece]] = [deque() for _ in range(self.workers)]
+        self.steals = 0
+
+    def _take(self, worker: int) -> Optional[Piece]:
+        queue = self.queues[worker]
+        if not queue:
+            return None
+        job_id, start, stop = queue.popleft()
+        if stop - start > self.grain:
+            queue.appendleft((job_id, start + self.grain, stop))
+            stop = start + self.grain
+        return job_id, start, stop
+
+    def _steal(self, worker: int) -> Optional[Piece]:
+        def remaining(queue: Deque[Piece]) -> int:
+            return sum(stop - start for _, start, stop in queue)
+
+        victim = max(range(self.workers), key=lambda index: remaining(self.queues[index]))
+        if not self.queues[victim]:
+            return None
+        self.steals += 1
+        job_id, start, stop = self.queues[victim].pop()
+        if stop - start > 2 * self.grain:
+            middle = (start + stop) // 2
+            self.queues[victim].append((job_id, start, middle))
+            start = middle
+        self.queues[worker].append((job_id, start, stop))
+        return self._take(worker)
+
+    async def run(self, jobs: List[DivisibleJob]) -> List[Any]:
+        results: List[Any] = [None] * len(jobs)
+        finished = [False] * len(jobs)
+        for job_id, job in enumerate(jobs):
+            self.queues[job_id % self.workers].append((job_id, job.start, job.stop))
+
+        async def worker_loop(worker: int):
+            while (piece := self._take(worker) or self._steal(worker)) is not None:
+                job_id, start, stop = piece
+                value = await run_cpu(jobs[job_id].fn, start, stop)
+                if finished[job_id]:
+                    results[job_id] = jobs[job_id].combine(results[job_id], value)
+                else:
+                    results[job_id] = value
+                    finished[job_id] = True
+
+        await asyncio.gather(*[worker_loop(worker) for worker in range(self.workers)])
+        return results
+
+
+async def main():
+    nums = [1000, 1, 3, 5, 22, 100000000]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[run_cpu(count_range, 0, num) for num in nums])
+    print(f'gather: {results} за {time.perf_counter() - start:.4f} с')
+
+    scheduler = WorkStealingScheduler()
+    start = time.perf_counter()
+    results = await scheduler.run([DivisibleJob(count_range, 0, num) for num in nums])
+    print(f'work stealing: {results} за {time.perf_counter() - start:.4f} с, перехватов {scheduler.steals}')
+
+    shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
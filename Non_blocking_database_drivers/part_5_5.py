@@ -5,7 +5,7 @@ from typing import List, Tuple, Union
 
 from random import randint, sample
 
-from utils import async_timed
+from utils import async_timed, enable, export_chrome_trace, format_tree, span, traced
 
 # ==================================================================
 # Вставка случайный марок
@@ -196,9 +196,18 @@ async def main():
 # ==================================================================
 # сравним время выполнения синхронного и асинхронного подхода.
 
+# От себя. query_product отмечена для трассировки (tracing.py), а ожидание
+# свободного соединения выделено в отдельный интервал pool.acquire: в дереве
+# query_products_concurrently -> query_product -> pool.acquire видно, сколько
+# времени запросы стоят в очереди к пулу из 6 соединений.
+@traced()
 async def query_product(pool):
-    async with pool.acquire() as connection:
+    async with span('pool.acquire'):
+        connection = await pool.acquire()
+    try:
         return await connection.fetchrow(product_query)
+    finally:
+        await pool.release(connection)
 
 
 @async_timed()
@@ -230,6 +239,29 @@ async def main():
     # asyncio.run(main())
 
 
+# От себя. То же с трассировкой: дерево интервалов в консоли и файл
+# query_products.trace.json для chrome://tracing
+
+async def main_traced():
+    enable()
+    async with asyncpg.create_pool(
+        host='127.0.0.1',
+        port=5432,
+        user='postgres',
+        password='password',
+        database='products',
+        min_size=6,
+        max_size=6
+    ) as pool:
+        await query_products_concurrently(pool, 10000)
+    print(format_tree(max_children=5))
+    export_chrome_trace('query_products.trace.json')
+
+
+# if __name__ == "__main__":
+#     asyncio.run(main_traced())
+
+
 # Вывод
 # выполняется <function query_products_synchronously at 0x7fb62c7184c0> с аргументами (<asyncpg.pool.Pool object at 0x7fb62c713530>, 10000) {}
 # <function query_products_synchronously at 0x7fb62c7184c0> завершилась за 3.4284 с
@@ -1,7 +1,11 @@
 import asyncio
-import functools
-import time
-from typing import Callable, Any
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень, см. timing.py
+
+from timing import async_timed
+from tracing import enable, export_chrome_trace, format_tree, span, traced
 
 
 async def delay(delay_seconds: int) -> int:
@@ -9,19 +13,3 @@ async def delay(delay_seconds: int) -> int:
     await asyncio.sleep(delay_seconds)
     print(f'сон в течение {delay_seconds} с закончился')
     return delay_seconds
-
-
-def async_timed():
-    def wrapper(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapped(*args, **kwargs) -> Any:
-            print(f'выполняется {func} с аргументами {args} {kwargs}')
-            start = time.time()
-            try:
-                return await func(*args, **kwargs)
-            finally:
-                end = time.time()
-                total = end - start
-                print(f'{func} завершилась за {total:.4f} с')
-        return wrapped
-    return wrapper
@@ -0,0 +1,116 @@
+# Нагрузочный тест эхо-серверов на локальной машине
+#
+# Сервер запускается отдельным процессом, клиенты - на asyncio в этом процессе:
+#   - соединений в секунду: concurrency клиентов подряд подключаются,
+#     отправляют строку, ждут эхо и закрывают соединение;
+#   - МБ/с: connections соединений одновременно гонят по volume байт
+#     порциями chunk и читают эхо обратно.
+# Сравниваются сопрограмма echo из part_3_5 (sock_recv / sock_sendall)
+# и EchoProtocol из echo_protocol.py. Оба слушают 127.0.0.1:8000.
+#
+#     python echo_benchmark.py part_3_5.py echo_protocol.py "echo_cluster.py 4"
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional, Sequence
+
+HOST, PORT = '127.0.0.1', 8000
+
+
+def start_server(script: str, args: Sequence[str] = ()) -> subprocess.Popen:
+    # Вывод сервера (print на каждое соединение) отбрасываем, чтобы не мерить терминал
+    directory = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, script, *args], cwd=directory,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, PORT), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f'Сервер {script} не начал слушать {HOST}:{PORT}')
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def connect_once(line: bytes):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    writer.write(line)
+    await reader.readexactly(len(line))
+    writer.close()
+    await writer.wait_closed()
+
+
+async def connections_per_second(total: int = 5_000, concurrency: int = 50) -> float:
+    line = b'ping\r\n'
+
+    async def client(count: int):
+        for _ in range(count):
+            await connect_once(line)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(total // concurrency) for _ in range(concurrency)])
+    return total // concurrency * concurrency / (time.perf_counter() - start)
+
+
+async def stream(volume: int, chunk: int):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    payload = b'x' * chunk
+
+    async def send():
+        for _ in range(volume // chunk):
+            writer.write(payload)
+            await writer.drain()
+
+    async def receive():
+        remaining = volume // chunk * chunk
+        while remaining:
+            data = await reader.read(256 * 1024)
+            if not data:
+                raise ConnectionError('Сервер закрыл соединение раньше времени')
+            remaining -= len(data)
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+    await writer.wait_closed()
+
+
+async def megabytes_per_second(connections: int = 8, volume: int = 32 * 2 ** 20, chunk: int = 64 * 1024) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[stream(volume, chunk) for _ in range(connections)])
+    return connections * volume / 2 ** 20 / (time.perf_counter() - start)
+
+
+async def run_benchmark(script: str, args: Sequence[str] = ()) -> List[float]:
+    server = start_server(script, args)
+    try:
+        await connections_per_second(200)  # прогрев
+        results = [await connections_per_second(), await megabytes_per_second()]
+    finally:
+        stop_server(server)
+    return results
+
+
+def main(scripts: Optional[List[str]] = None):
+    # Аргументы сервера пишутся через пробел после имени скрипта
+    for command in scripts or ['part_3_5.py', 'echo_protocol.py']:
+        script, *args = command.split()
+        per_second, throughput = asyncio.run(run_benchmark(script, args))
+        print(f'{command}: {per_second:.0f} соединений/с, {throughput:.1f} МБ/с')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
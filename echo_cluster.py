@@ -0,0 +1,148 @@
+# Эхо-сервер на нескольких ядрах: N процессов-исполнителей на одном порту
+#
+# Серверы из part_3_4, part_3_5 и part_3_6 работают в одном процессе
+# с одним циклом событий и упираются в одно ядро. Здесь запускающий процесс
+# делает fork N исполнителей, и у каждого свой цикл событий:
+#   - если ОС поддерживает SO_REUSEPORT (Linux, BSD, macOS), каждый
+#     исполнитель сам открывает сокет на 127.0.0.1:8000, а ядро ОС
+#     распределяет входящие соединения между сокетами;
+#   - иначе родитель открывает один слушающий сокет до fork, исполнители
+#     наследуют его и принимают соединения по очереди.
+# Соединения обслуживает сопрограмма echo из part_3_5.
+#
+# Остановка - как в part_3_6: родитель по SIGINT/SIGTERM один раз пересылает
+# SIGTERM исполнителям, в исполнителе обработчик shutdown возбуждает
+# GracefulExit (только на первый сигнал), после чего исполнитель
+# закрывает слушающий сокет (новых соединений больше не будет - в part_3_6
+# этого не хватало) и дает задачам echo до 2 с на завершение
+# (close_echo_tasks). Родитель проверяет коды завершения исполнителей.
+#
+#     python echo_cluster.py [число исполнителей]
+
+import asyncio
+import os
+import signal
+import socket
+import sys
+import traceback
+from asyncio import AbstractEventLoop
+from typing import List, Optional
+
+from part_3_5 import echo
+from part_3_6 import GracefulExit, close_echo_tasks, shutdown
+
+SERVER_ADDRESS = ('127.0.0.1', 8000)
+
+
+def reuse_port_supported() -> bool:
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        return False
+    with socket.socket() as probe:
+        try:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError:
+            return False
+    return True
+
+
+def create_listener(reuse_port: bool) -> socket.socket:
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.setblocking(False)
+    server_socket.bind(SERVER_ADDRESS)
+    server_socket.listen(1024)
+    return server_socket
+
+
+async def connection_listener(server_socket: socket.socket, loop: AbstractEventLoop, echo_tasks: List[asyncio.Task]):
+    # Как в part_3_6, но без print на каждое соединение и со своим списком задач
+    while True:
+        connection, address = await loop.sock_accept(server_socket)
+        connection.setblocking(False)
+        echo_task = asyncio.create_task(echo(connection, loop))
+        echo_tasks.append(echo_task)
+        # Завершенные задачи убираем сразу: в списке только живые соединения
+        echo_task.add_done_callback(echo_tasks.remove)
+
+
+def run_worker(server_socket: Optional[socket.socket]):
+    if server_socket is None:
+        server_socket = create_listener(reuse_port=True)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stopping = False
+
+    def stop():
+        # Ctrl+C в терминале получают все процессы группы, а родитель еще
+        # и пересылает SIGTERM: GracefulExit возбуждается только на первый
+        # сигнал, иначе второй прервет close_echo_tasks
+        nonlocal stopping
+        if not stopping:
+            stopping = True
+            shutdown()
+
+    for signame in ('SIGINT', 'SIGTERM'):
+        loop.add_signal_handler(getattr(signal, signame), stop)
+    echo_tasks: List[asyncio.Task] = []
+    listener = loop.create_task(connection_listener(server_socket, loop, echo_tasks))
+    try:
+        loop.run_until_complete(listener)
+    except GracefulExit:
+        listener.cancel()
+        server_socket.close()
+        loop.run_until_complete(close_echo_tasks(echo_tasks))
+    finally:
+        loop.close()
+
+
+def main(workers: Optional[int] = None):
+    workers = workers or os.cpu_count() or 1
+    reuse_port = reuse_port_supported()
+    shared_socket = None if reuse_port else create_listener(reuse_port=False)
+    print(f'Запуск {workers} исполнителей, '
+          f'{"SO_REUSEPORT" if reuse_port else "общий унаследованный сокет"}')
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(shared_socket)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children.append(pid)
+    if shared_socket is not None:
+        shared_socket.close()
+
+    def forward(signum, frame):
+        # Пересылаем один раз, повторные сигналы родитель игнорирует
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    failed = 0
+    for child in children:
+        _, status = os.waitpid(child, 0)
+        code = os.waitstatus_to_exitcode(status)
+        if code != 0:
+            print(f'Исполнитель {child} завершился с кодом {code}')
+            failed += 1
+    if failed:
+        raise SystemExit(1)
+    print('Все исполнители остановлены')
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,195 @@
+# Эхо-сервер на транспортах и протоколах вместо sock_recv / sock_sendall
+#
+# В part_3_5 и part_3_6 на каждое соединение работает сопрограмма echo:
+# await loop.sock_recv(connection, 1024), затем await loop.sock_sendall.
+# Каждое чтение в 1 КБ - это новый будущий объект, регистрация сокета
+# в селекторе, переключение задачи и новый объект bytes.
+#
+# EchoProtocol - тот же сервис на asyncio.BufferedProtocol: цикл событий
+# сам читает из сокета прямо в заранее выделенный буфер (get_buffer),
+# а buffer_updated сразу отдает прочитанное транспорту, который пытается
+# отправить данные немедленно, без переключения задач.
+# Ошибка на b'boom\r\n' обрабатывается так же, как в echo: исключение
+# записывается в журнал, соединение закрывается.
+#
+# Обратное давление. Эхо-сервер пишет столько же, сколько читает, и если
+# клиент (или прокси перед медленным клиентом) не забирает ответы, буфер
+# записи транспорта растет без предела. Поэтому:
+#   - у каждого соединения есть водяные знаки буфера записи
+#     (set_write_buffer_limits): выше high транспорт вызывает pause_writing,
+#     и протокол перестает читать (pause_reading); ниже low - resume_writing,
+#     и чтение возобновляется;
+#   - BufferBudget ограничивает сумму буферов записи всех соединений:
+#     соединение, которое превысило общий high, перестает читать, пока сумма
+#     не опустится до low, и заодно считает приостановленные соединения.
+# В итоге на соединение приходится не больше high + BUFFER_SIZE байт,
+# сколько бы ни прислал клиент.
+
+import asyncio
+import functools
+import logging
+from asyncio import BaseTransport, Transport
+from typing import Dict, Optional, Set
+
+BUFFER_SIZE = 64 * 1024
+
+WRITE_HIGH_WATER = 256 * 1024
+
+WRITE_LOW_WATER = 64 * 1024
+
+
+class BufferBudget:
+    def __init__(self, high: Optional[int] = 64 * 2 ** 20, low: Optional[int] = None, check_interval: float = 0.01):
+        # high=None - общего предела нет, остаются только счетчики
+        self.high = high
+        self.low = low if low is not None else (high // 2 if high else None)
+        self.check_interval = check_interval
+        self.connections: Set['EchoProtocol'] = set()
+        self.over_budget: Set['EchoProtocol'] = set()
+        self.total = 0
+        self.pauses = 0
+        self._checking = False
+
+    @property
+    def paused_connections(self) -> int:
+        return sum(1 for protocol in self.connections if protocol.paused_by)
+
+    def stats(self) -> Dict[str, int]:
+        return {'connections': len(self.connections),
+                'paused_connections': self.paused_connections,
+                'pauses': self.pauses,
+                'buffered_bytes': self.total}
+
+    def add(self, protocol: 'EchoProtocol'):
+        self.connections.add(protocol)
+
+    def remove(self, protocol: 'EchoProtocol'):
+        self.connections.discard(protocol)
+        self.over_budget.discard(protocol)
+        self.total -= protocol.reported
+
+    def report(self, protocol: 'EchoProtocol', size: int):
+        # Вызывается после каждой записи; уменьшение буферов при отправке
+        # транспорт не сообщает, поэтому сумма пересчитывается в _check
+        self.total += size - protocol.reported
+        protocol.reported = size
+        if self.high is not None and self.total > self.high and protocol not in self.over_budget:
+            self.over_budget.add(protocol)
+            protocol.pause('budget')
+            if not self._checking:
+                self._checking = True
+                asyncio.get_running_loop().call_later(self.check_interval, self._check)
+
+    def _check(self):
+        # Пока кто-то стоит из-за общего предела, раз в check_interval
+        # пересчитываем сумму по всем транспортам
+        self.total = 0
+        for protocol in self.connections:
+            protocol.reported = protocol.transport.get_write_buffer_size()
+            self.total += protocol.reported
+        if self.total <= self.low:
+            self._checking = False
+            for protocol in self.over_budget:
+                protocol.resume('budget')
+            self.over_budget.clear()
+        else:
+            asyncio.get_running_loop().call_later(self.check_interval, self._check)
+
+
+class EchoProtocol(asyncio.BufferedProtocol):
+    def __init__(self,
+                 buffer_size: int = BUFFER_SIZE,
+                 high_water: int = WRITE_HIGH_WATER,
+                 low_water: int = WRITE_LOW_WATER,
+                 budget: Optional[BufferBudget] = None):
+        self._buffer = memoryview(bytearray(buffer_size))
+        self.transport: Optional[Transport] = None
+        self.high_water = high_water
+        self.low_water = low_water
+        self.budget = budget
+        self.paused_by: Set[str] = set()  # 'write_buffer' и/или 'budget'
+        self.reported = 0
+
+    def connection_made(self, transport: BaseTransport):
+        self.transport = transport  # type: ignore
+        self.transport.set_write_buffer_limits(self.high_water, self.low_water)
+        if self.budget is not None:
+            self.budget.add(self)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if self.budget is not None:
+            self.budget.remove(self)
+
+    def pause(self, reason: str):
+        if not self.paused_by:
+            self.transport.pause_reading()
+            if self.budget is not None:
+                self.budget.pauses += 1
+        self.paused_by.add(reason)
+
+    def resume(self, reason: str):
+        self.paused_by.discard(reason)
+        if not self.paused_by and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+    def pause_writing(self):
+        self.pause('write_buffer')
+
+    def resume_writing(self):
+        self.resume('write_buffer')
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._buffer
+
+    def buffer_updated(self, nbytes: int):
+        data = self._buffer[:nbytes]
+        try:
+            if data == b'boom\r\n':
+                raise Exception("Неожиданная ошибка сети")
+            # Копия обязательна: буфер перезапишется следующим чтением, а транспорт
+            # (с 3.12) может держать ссылку на неотправленный остаток без копирования
+            self.transport.write(bytes(data))
+            if self.budget is not None:
+                self.budget.report(self, self.transport.get_write_buffer_size())
+        except Exception as ex:
+            logging.exception(ex)
+            self.transport.close()
+
+    def eof_received(self) -> bool:
+        # False - транспорт закроется сам, как echo закрывает соединение
+        # после пустого sock_recv
+        return False
+
+
+async def serve(host: str = '127.0.0.1',
+                port: int = 8000,
+                high_water: int = WRITE_HIGH_WATER,
+                low_water: int = WRITE_LOW_WATER,
+                budget: Optional[BufferBudget] = None) -> asyncio.AbstractServer:
+    loop = asyncio.get_running_loop()
+    factory = functools.partial(EchoProtocol, high_water=high_water, low_water=low_water, budget=budget)
+    return await loop.create_server(factory, host, port, reuse_address=True)
+
+
+async def report_budget(budget: BufferBudget, interval: float = 10.0):
+    last = None
+    while True:
+        await asyncio.sleep(interval)
+        stats = budget.stats()
+        if stats != last:
+            print(f'Соединений {stats["connections"]}, приостановлено {stats["paused_connections"]}, '
+                  f'всего пауз {stats["pauses"]}, в буферах записи {stats["buffered_bytes"]} байт')
+            last = stats
+
+
+async def main():
+    budget = BufferBudget()
+    server = await serve(budget=budget)
+    reporter = asyncio.create_task(report_budget(budget))
+    async with server:
+        await server.serve_forever()
+    reporter.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+# Гистограмма времен в стиле HDR (High Dynamic Range)
+#
+# Значения (наносекунды, целые) раскладываются по корзинам: каждая степень
+# двойки делится на 2 ** sub_bucket_bits равных частей. Относительная
+# погрешность при этом постоянна (для 5 бит - около 3 %), а число корзин
+# растет логарифмически: от 1 нс до часа - несколько сотен корзин.
+# Запись - несколько целочисленных операций и одно обращение к словарю,
+# никакого форматирования строк; перцентили считаются только по запросу.
+
+import json
+from typing import Dict, Iterable, Optional
+
+NS_IN_SECOND = 1_000_000_000
+
+
+class Histogram:
+    def __init__(self, sub_bucket_bits: int = 5):
+        self.bits = sub_bucket_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.bits
+        if shift <= 0:
+            return value
+        return (shift << self.bits) + (value >> shift)
+
+    def _bounds(self, index: int):
+        # Границы корзины [lower, upper)
+        shift = index >> self.bits
+        if shift == 0:
+            return index, index + 1
+        lower = (index & ((1 << self.bits) - 1)) << shift
+        return lower, lower + (1 << shift)
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram'):
+        assert self.bits == other.bits
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.__init__(self.bits)
+
+    def percentile(self, percent: float) -> int:
+        # Значение берется как середина корзины в пределах [min, max]
+        if not self.count:
+            return 0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                lower, upper = self._bounds(index)
+                return max(min((lower + upper) // 2, self.max), self.min)
+        return self.max
+
+    def percentiles(self, percents: Iterable[float] = (50, 95, 99)) -> Dict[float, int]:
+        return {percent: self.percentile(percent) for percent in percents}
+
+    def summary(self) -> dict:
+        # Все времена - в секундах
+        return {
+            'count': self.count,
+            'mean': self.total / self.count / NS_IN_SECOND if self.count else 0.0,
+            'min': (self.min or 0) / NS_IN_SECOND,
+            'max': self.max / NS_IN_SECOND,
+            **{f'p{percent:g}': value / NS_IN_SECOND for percent, value in self.percentiles().items()},
+        }
+
+    def cumulative_octaves(self):
+        # (верхняя граница, накопленное число значений) по степеням двойки:
+        # корзина никогда не пересекает степень двойки, поэтому границы точные
+        octaves: Dict[int, int] = {}
+        for index, count in self.counts.items():
+            upper = 1 << (self._bounds(index)[0].bit_length())
+            octaves[upper] = octaves.get(upper, 0) + count
+        seen = 0
+        for upper in sorted(octaves):
+            seen += octaves[upper]
+            yield upper, seen
+
+
+def _labels(labels: Dict[str, str], **extra: str) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def to_prometheus(name: str, histogram: Histogram, labels: Optional[Dict[str, str]] = None) -> str:
+    # Формат текстовой выдачи Prometheus: накопленные корзины le (в секундах),
+    # затем _sum и _count. Строку TYPE вызывающий код пишет один раз на метрику.
+    labels = labels or {}
+    lines = [f'{name}_bucket{_labels(labels, le=repr(upper / NS_IN_SECOND))} {seen}'
+             for upper, seen in histogram.cumulative_octaves()]
+    lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(labels)} {histogram.total / NS_IN_SECOND!r}')
+    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+    return '\n'.join(lines)
+
+
+def to_json(histograms: Dict[str, Histogram]) -> str:
+    return json.dumps({name: histogram.summary() for name, histogram in histograms.items()},
+                      ensure_ascii=False, indent=2)
@@ -0,0 +1,137 @@
+# Сервер строк на реакторе вместо опроса в цикле из part_3_3
+#
+# Неблокирующий сервер из листинга 3.4 (part_3_3):
+#   - крутится в while True, ловя BlockingIOError, и занимает 100 % ядра,
+#     даже когда клиентов нет;
+#   - читает по 2 байта на recv и склеивает buffer = buffer + data, то есть
+#     на строку длиной n копирует O(n^2) байт;
+#   - если строка пришла не целиком, BlockingIOError вылетает посреди
+#     цикла, и уже прочитанная часть строки пропадает вместе с buffer.
+#
+# LineHandler работает на reactor.Reactor:
+#   - процесс спит в epoll.poll, пока нет событий готовности;
+#   - recv_into пишет прямо в буфер соединения (bytearray переиспользуется,
+#     необработанный хвост сдвигается в начало, буфер растет только под
+#     строку длиннее себя);
+#   - '\r\n' ищется только в новых байтах: позиция, до которой буфер уже
+#     просмотрен, хранится между чтениями;
+#   - за одно чтение обрабатываются все целые строки, неполная строка
+#     остается в буфере до следующего чтения.
+# Как и в part_3_3, каждая строка (вместе с '\r\n') отправляется обратно.
+
+import asyncio
+import os
+import sys
+import time
+from typing import Optional
+
+from reactor import Connection, Reactor
+
+MAX_LINE = 16 * 2 ** 20
+
+
+class LineHandler:
+    def __init__(self, max_line: int = MAX_LINE):
+        self.max_line = max_line
+        self.scanned = 0  # сколько байт от начала необработанных данных уже просмотрено
+
+    def data_received(self, connection: Connection):
+        buffer = connection.read_buffer
+        while True:
+            start = connection.read_start
+            # '\r' мог оказаться последним байтом прошлого чтения
+            end = buffer.find(b'\r\n', start + max(self.scanned - 1, 0), connection.read_end)
+            if end == -1:
+                self.scanned = connection.read_end - start
+                if self.scanned > self.max_line:
+                    raise ValueError(f'Строка длиннее {self.max_line} байт')
+                return
+            line_length = end + 2 - start
+            self.line_received(connection, connection.readable()[:line_length])
+            connection.consume(line_length)
+            self.scanned = 0
+            if connection.closed:
+                return
+
+    def line_received(self, connection: Connection, line: memoryview):
+        connection.write(line)
+
+
+def main():
+    reactor = Reactor()
+    reactor.listen(('127.0.0.1', 8000), LineHandler)
+    try:
+        reactor.run()
+    finally:
+        reactor.close()
+
+
+# ==================================================================
+# Загрузка процессора без клиентов и пропускная способность на длинных строках
+
+def cpu_seconds(pid: int) -> float:
+    # utime + stime из /proc/<pid>/stat (Linux, как и epoll)
+    with open(f'/proc/{pid}/stat') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+async def idle_cpu(pid: int, connections: int = 10, seconds: float = 2.0) -> float:
+    clients = [await asyncio.open_connection('127.0.0.1', 8000) for _ in range(connections)]
+    start_cpu, start = cpu_seconds(pid), time.perf_counter()
+    await asyncio.sleep(seconds)
+    usage = (cpu_seconds(pid) - start_cpu) / (time.perf_counter() - start)
+    for _, writer in clients:
+        writer.close()
+    return usage
+
+
+async def long_lines(connections: int = 4, lines: int = 20, line_size: int = 2 ** 20) -> float:
+    line = b'x' * (line_size - 2) + b'\r\n'
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', 8000)
+
+        async def send():
+            for _ in range(lines):
+                writer.write(line)
+                await writer.drain()
+
+        async def receive():
+            for _ in range(lines):
+                assert await reader.readexactly(line_size) == line
+
+        await asyncio.gather(send(), receive())
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(connections)])
+    return connections * lines * line_size / 2 ** 20 / (time.perf_counter() - start)
+
+
+async def benchmark_server(script: str, timeout: float = 30.0, line_size: int = 2 ** 20):
+    from echo_benchmark import start_server, stop_server
+
+    server = start_server(script)
+    try:
+        print(f'{script}: процессор без нагрузки {await idle_cpu(server.pid) * 100:.0f} %')
+        try:
+            throughput = await asyncio.wait_for(long_lines(line_size=line_size), timeout)
+            print(f'{script}: строки по {line_size} байт, {throughput:.1f} МБ/с')
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            print(f'{script}: строки по {line_size} байт не вернулись за {timeout:.0f} с')
+    finally:
+        stop_server(server)
+
+
+def benchmark(line_size: Optional[int] = None):
+    line_size = line_size or 64 * 1024
+    for script in ('part_3_3.py', 'line_server.py'):
+        asyncio.run(benchmark_server(script, line_size=line_size))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['benchmark']:
+        benchmark()
+    else:
+        main()
@@ -0,0 +1,259 @@
+# Метрики здоровья цикла событий
+#
+# В part_2_8 цикл событий только получают (get_running_loop) и ставят
+# в него функцию (call_soon). LoopMonitor следит за самим циклом:
+#   - задержка планирования: раз в interval ставится call_later, и разница
+#     между ожидаемым и фактическим временем срабатывания попадает
+#     в гистограмму loop_lag (если цикл кто-то блокирует, она растет);
+#   - глубина очереди готовых обратных вызовов (loop._ready) - сколько
+#     работы ждет своей очереди прямо сейчас;
+#   - число активных задач (asyncio.all_tasks()); all_tasks обходит все
+#     задачи (при 20 тыс. задач - около 9 мс), поэтому число обновляется
+#     только раз в active_tasks_every срабатываний;
+#   - время работы задач (track_tasks=True, по умолчанию выключено):
+#     фабрика задач оборачивает сопрограмму и суммирует время ее шагов
+#     (только работа в цикле, без ожидания), гистограмма task_run. Обертка
+#     на Python заметно дороже шага задачи на C, поэтому измеряется только
+#     каждая task_sample_every-я задача.
+# serve_metrics отдает все это по HTTP в текстовом формате Prometheus
+# (/metrics) или в JSON (/metrics.json).
+#
+# Накладные расходы. Без track_tasks монитор - это один обратный вызов раз
+# в interval: при 20 тыс. живых задач в среднем около 1,2 мс на срабатывание,
+# то есть около 0,25 % при interval=0.5 (а без задач - микросекунды), так что
+# его можно не выключать под нагрузкой. С track_tasks фабрика задач на Python
+# вызывается на каждую задачу: benchmark_overhead на 20 тыс. коротких задач
+# показывает 4-18 % (около 10 % на пустых задачах) - это режим для отладки,
+# а не для постоянной работы.
+
+import asyncio
+import collections.abc
+import json
+import time
+from asyncio import AbstractEventLoop
+from typing import Any, Coroutine, Optional
+
+from histogram import Histogram, to_json, to_prometheus
+
+
+class _TimedCoroutine(collections.abc.Coroutine):
+    # Обертка над сопрограммой, которая измеряет каждый шаг send/throw
+    __slots__ = ('_coro', '_histogram', '_elapsed')
+
+    def __init__(self, coro: Coroutine, histogram: Histogram):
+        self._coro = coro
+        self._histogram = histogram
+        self._elapsed = 0
+
+    def send(self, value):
+        start = time.perf_counter_ns()
+        try:
+            return self._coro.send(value)
+        except BaseException:
+            self._finish(start)
+            raise
+        finally:
+            self._elapsed += time.perf_counter_ns() - start
+
+    def throw(self, *args):
+        start = time.perf_counter_ns()
+        try:
+            return self._coro.throw(*args)
+        except BaseException:
+            self._finish(start)
+            raise
+        finally:
+            self._elapsed += time.perf_counter_ns() - start
+
+    def _finish(self, start: int):
+        self._histogram.record(self._elapsed + time.perf_counter_ns() - start)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    def __getattr__(self, name: str) -> Any:
+        # cr_frame, __qualname__ и прочее - у исходной сопрограммы
+        return getattr(self._coro, name)
+
+
+class LoopMonitor:
+    def __init__(self,
+                 interval: float = 0.5,
+                 track_tasks: bool = False,
+                 task_sample_every: int = 100,
+                 active_tasks_every: int = 10):
+        self.interval = interval
+        self.track_tasks = track_tasks
+        self.task_sample_every = task_sample_every
+        self.active_tasks_every = active_tasks_every
+        self._created = 0
+        self._ticks = 0
+        self.loop_lag = Histogram()
+        self.task_run = Histogram()
+        self.ready_queue = 0
+        self.ready_queue_max = 0
+        self.active_tasks = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._previous_factory = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self.track_tasks:
+            self._previous_factory = loop.get_task_factory()
+            loop.set_task_factory(self._task_factory)
+        self._schedule(loop)
+
+    def stop(self):
+        loop = asyncio.get_running_loop()
+        if self._handle is not None:
+            self._handle.cancel()
+        if self.track_tasks:
+            loop.set_task_factory(self._previous_factory)
+
+    def _task_factory(self, loop: AbstractEventLoop, coro: Coroutine, **kwargs: Any) -> asyncio.Future:
+        self._created += 1
+        if self._created % self.task_sample_every == 0:
+            coro = _TimedCoroutine(coro, self.task_run)
+        if self._previous_factory is not None:
+            return self._previous_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    def _schedule(self, loop: AbstractEventLoop):
+        expected = time.perf_counter_ns() + int(self.interval * 1e9)
+        self._handle = loop.call_later(self.interval, self._tick, loop, expected)
+
+    def _tick(self, loop: AbstractEventLoop, expected: int):
+        self.loop_lag.record(time.perf_counter_ns() - expected)
+        # _ready - внутренняя очередь BaseEventLoop, у других циклов (uvloop) ее нет
+        self.ready_queue = len(getattr(loop, '_ready', ()))
+        self.ready_queue_max = max(self.ready_queue_max, self.ready_queue)
+        if self._ticks % self.active_tasks_every == 0:
+            self.active_tasks = len(asyncio.all_tasks(loop))
+        self._ticks += 1
+        self._schedule(loop)
+
+    def histograms(self):
+        return {'loop_lag': self.loop_lag, 'task_run': self.task_run}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, histogram in self.histograms().items():
+            lines.append(f'# TYPE asyncio_{name}_seconds histogram')
+            lines.append(to_prometheus(f'asyncio_{name}_seconds', histogram))
+        for name in ('ready_queue', 'ready_queue_max', 'active_tasks'):
+            lines.append(f'# TYPE asyncio_{name} gauge')
+            lines.append(f'asyncio_{name} {getattr(self, name)}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self) -> str:
+        data = json.loads(to_json(self.histograms()))
+        data.update(ready_queue=self.ready_queue,
+                    ready_queue_max=self.ready_queue_max,
+                    active_tasks=self.active_tasks)
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+async def serve_metrics(monitor: LoopMonitor, host: str = '127.0.0.1', port: int = 9100) -> asyncio.AbstractServer:
+    # Минимальный HTTP-сервер: читаем строку запроса, отвечаем и закрываем соединение
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+            if path == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', monitor.to_prometheus()
+            elif path == '/metrics.json':
+                status, content_type, body = '200 OK', 'application/json', monitor.to_json()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'not found\n'
+            data = body.encode()
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                         f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# ==================================================================
+# Нагрузка: много коротких задач, изредка блокирующий вызов
+
+async def workload(tasks: int = 100_000, block_every: int = 0):
+    async def short_task(index: int):
+        await asyncio.sleep(0)
+        if block_every and index % block_every == 0:
+            time.sleep(0.05)
+
+    await asyncio.gather(*[short_task(index) for index in range(tasks)])
+
+
+async def tick_cost(tasks: int = 20_000, ticks: int = 200) -> float:
+    # Среднее процессорное время одного срабатывания монитора при tasks
+    # живых задачах. Прогон workload короче interval, и монитор без
+    # track_tasks в нем почти не срабатывает, поэтому его цена считается так.
+    monitor = LoopMonitor()
+    loop = asyncio.get_running_loop()
+    release = asyncio.Event()
+    waiting = [asyncio.create_task(release.wait()) for _ in range(tasks)]
+    await asyncio.sleep(0)
+    start = time.process_time()
+    for _ in range(ticks):
+        monitor._tick(loop, time.perf_counter_ns())
+        monitor._handle.cancel()
+    elapsed = (time.process_time() - start) / ticks
+    release.set()
+    await asyncio.gather(*waiting)
+    return elapsed
+
+
+async def benchmark_overhead(tasks: int = 20_000, repeats: int = 20):
+    per_tick = await tick_cost(tasks)
+    interval = LoopMonitor().interval
+    print(f'Монитор без track_tasks: {per_tick * 1000:.2f} мс на срабатывание при {tasks} задачах, '
+          f'накладные расходы {per_tick / interval * 100:.2f} % при interval={interval}')
+
+    # Замеры с track_tasks и без монитора чередуются, чтобы шум машины влиял
+    # на оба одинаково; считается процессорное время, а не время по часам
+    async def measure(monitor: Optional[LoopMonitor]) -> float:
+        if monitor is not None:
+            monitor.start()
+        start = time.process_time()
+        await workload(tasks)
+        elapsed = time.process_time() - start
+        if monitor is not None:
+            monitor.stop()
+        return elapsed
+
+    without, with_monitor = [], []
+    for _ in range(repeats):
+        without.append(await measure(None))
+        with_monitor.append(await measure(LoopMonitor(track_tasks=True)))
+    without, with_monitor = min(without), min(with_monitor)
+    print(f'Без монитора: {without:.4f} с, с track_tasks: {with_monitor:.4f} с, '
+          f'накладные расходы {(with_monitor / without - 1) * 100:.1f} %')
+
+
+async def main():
+    monitor = LoopMonitor(interval=0.1, track_tasks=True)
+    monitor.start()
+    server = await serve_metrics(monitor)
+    await workload(20_000, block_every=5_000)
+    reader, writer = await asyncio.open_connection('127.0.0.1', 9100)
+    writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    print((await reader.read()).decode())
+    writer.close()
+    print(monitor.to_json())
+    server.close()
+    await server.wait_closed()
+    monitor.stop()
+    await benchmark_overhead()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,25 +3,30 @@
     # Листинг 2.16 Декоратор для хронометража сопрограмм
 
 import asyncio
-import functools
-import time
-from typing import Callable, Any
-
-
-def async_timed():
-    def wrapper(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapped(*args, **kwargs) -> Any:
-            print(f'выполняется {func} с аргументами {args} {kwargs}')
-            start = time.time()
-            try:
-                return await func(*args, **kwargs)
-            finally:
-                end = time.time()
-                total = end - start
-                print(f'{func} завершилась за {total:.4f} с')
-        return wrapped
-    return wrapper
+# import functools
+# import time
+# from typing import Callable, Any
+
+
+# def async_timed():
+#     def wrapper(func: Callable) -> Callable:
+#         @functools.wraps(func)
+#         async def wrapped(*args, **kwargs) -> Any:
+#             print(f'выполняется {func} с аргументами {args} {kwargs}')
+#             start = time.time()
+#             try:
+#                 return await func(*args, **kwargs)
+#             finally:
+#                 end = time.time()
+#                 total = end - start
+#                 print(f'{func} завершилась за {total:.4f} с')
+#         return wrapped
+#     return wrapper
+
+# От себя. Листинг оставлен для справки, а декоратор берется из timing.py:
+# печать с repr аргументов на каждом вызове и time.time() заменены записью
+# в гистограмму по perf_counter_ns, сводка печатается при выходе из программы.
+from timing import async_timed
 
 
 @async_timed()
@@ -129,3 +129,47 @@ asyncio.run(main_get_example_status())
 # к разбору далее
 # 2.8
 # Ручное управление циклом событий
+
+
+# ==================================================================
+# От себя. Поиск блокировок цикла событий и их устранение
+#
+# StallDetector сообщает, какая задача и какая строка держали цикл событий
+# дольше threshold; в примере выше это будут строки цикла for в
+# cpu_bound_work и вызов requests.get в get_example_status.
+# offload переносит тело такой сопрограммы в пул процессов (счетный код)
+# или потоков (блокирующий ввод-вывод), не меняя вызывающий код.
+
+from stall_detector import StallDetector, offload
+
+
+async def main_find_stalls():
+    async with StallDetector(threshold=0.1) as detector:
+        await asyncio.gather(cpu_bound_work(), cpu_bound_work(), delay(4))
+    print(f'Найдено блокировок: {len(detector.stalls)}')
+
+
+@async_timed()
+@offload('process')
+async def cpu_bound_work_offloaded() -> int:
+    counter = 0
+    for i in range(100000000):
+        counter = counter + 1
+    return counter
+
+
+@async_timed()
+@offload('thread')
+async def get_example_status_offloaded() -> int:
+    return requests.get('http://www.google.com').status_code
+
+
+async def main_offloaded():
+    async with StallDetector(threshold=0.1) as detector:
+        await asyncio.gather(cpu_bound_work_offloaded(), cpu_bound_work_offloaded(), delay(4),
+                             get_example_status_offloaded(), get_example_status_offloaded())
+    print(f'Найдено блокировок: {len(detector.stalls)}')
+
+
+# asyncio.run(main_find_stalls())
+# asyncio.run(main_offloaded())
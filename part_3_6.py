@@ -89,14 +89,17 @@ async def main():
         loop.add_signal_handler(getattr(signal, signame), shutdown)
     await connection_listener(server_socket, loop)
 
-loop = asyncio.new_event_loop()
-
-try:
-    loop.run_until_complete(main())
-except GracefulExit:
-    loop.run_until_complete(close_echo_tasks(echo_tasks))
-finally:
-    loop.close()
+# От себя. Запуск спрятан под __main__, чтобы GracefulExit и close_echo_tasks
+# можно было импортировать (echo_cluster.py) без запуска сервера.
+if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+
+    try:
+        loop.run_until_complete(main())
+    except GracefulExit:
+        loop.run_until_complete(close_echo_tasks(echo_tasks))
+    finally:
+        loop.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+# Реактор на epoll с уведомлениями по фронту (edge-triggered)
+#
+# Цикл из part_3_4 построен на selectors.DefaultSelector:
+#   - select(timeout=1) просыпается раз в секунду, даже когда событий нет;
+#   - чтение по уровню (level-triggered) по 1024 байта: пока в сокете есть
+#     данные, каждый select снова возвращает этот сокет;
+#   - event_socket.send(data) без проверки результата: если буфер ядра
+#     заполнен, send отправит часть данных, а остаток потеряется.
+#
+# Reactor - основа для других серверов:
+#   - epoll с EPOLLET: уведомление приходит один раз на появление данных,
+#     поэтому сокет читается до BlockingIOError, а accept - до пустой очереди;
+#   - у соединения свой буфер чтения (bytearray, в который recv_into пишет
+#     напрямую) и свой буфер записи; write сначала пробует отправить сразу,
+#     остаток копит, и только тогда подписывается на EPOLLOUT, а после
+#     отправки всего буфера отписывается;
+#   - события обрабатываются пачками до max_events за один вызов poll;
+#   - таймеры - колесо (TimerWheel): постановка и снятие за O(1),
+#     а время ожидания poll - до ближайшей непустой ячейки колеса.
+#
+# Обратное давление: если буфер записи соединения вырос выше high_water
+# (клиент не забирает ответы), соединение перестает читать, пока буфер
+# не опустится до low_water. Так же общий budget_high ограничивает сумму
+# буферов записи всех соединений. С EPOLLET для паузы достаточно не читать
+# сокет: ядро перестанет принимать данные и закроет окно TCP, а при
+# возобновлении реактор сразу дочитывает накопившееся. Счетчики - stats().
+#
+# Обработчик соединения - объект с методами connection_made(connection),
+# data_received(connection) и connection_lost(connection), как у
+# протоколов asyncio. data_received читает connection.readable() и
+# отмечает обработанное через connection.consume(n).
+#
+# epoll есть только в Linux; на других ОС - selectors из part_3_4.
+
+import logging
+import select
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class Timer:
+    __slots__ = ('rounds', 'callback', 'args', 'cancelled')
+
+    def __init__(self, rounds: int, callback: Callable, args: tuple):
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    # Колесо из slots ячеек по tick секунд: таймер кладется в ячейку
+    # (текущая + задержка в тиках) % slots и ждет нужное число полных оборотов
+    def __init__(self, tick: float = 0.01, slots: int = 512):
+        self.tick = tick
+        self.wheel: List[List[Timer]] = [[] for _ in range(slots)]
+        self.position = 0
+        self.pending = 0
+        self.last_tick = time.monotonic()
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        if not self.pending:
+            self.last_tick = time.monotonic()
+        ticks = max(1, round(delay / self.tick))
+        # Колесо доходит до ячейки (текущая + ticks) через ticks % slots тиков,
+        # а при ticks, кратном slots, - через полный оборот; отсюда ticks - 1
+        timer = Timer((ticks - 1) // len(self.wheel), callback, args)
+        self.wheel[(self.position + ticks) % len(self.wheel)].append(timer)
+        self.pending += 1
+        return timer
+
+    def next_timeout(self) -> Optional[float]:
+        # Ждем до ближайшей непустой ячейки, а не до следующего тика, иначе
+        # poll просыпался бы каждые tick секунд, пока есть хотя бы один таймер
+        if not self.pending:
+            return None
+        slots = len(self.wheel)
+        distance = next(distance for distance in range(1, slots + 1)
+                        if self.wheel[(self.position + distance) % slots])
+        return max(0.0, self.last_tick + distance * self.tick - time.monotonic())
+
+    def advance(self):
+        now = time.monotonic()
+        if not self.pending:
+            # Пустое колесо не прокручиваем: после долгого простоя это были бы
+            # тысячи пустых тиков
+            self.last_tick = now
+            return
+        while now - self.last_tick >= self.tick:
+            self.last_tick += self.tick
+            self.position = (self.position + 1) % len(self.wheel)
+            slot = self.wheel[self.position]
+            if not slot:
+                continue
+            # Ячейку снимаем с колеса до вызовов: обратный вызов может поставить
+            # таймер ровно на полный оборот, то есть в эту же ячейку, и такой
+            # таймер должен дождаться следующего оборота, а не сработать сейчас
+            self.wheel[self.position] = []
+            waiting = []
+            for timer in slot:
+                if timer.cancelled:
+                    self.pending -= 1
+                elif timer.rounds:
+                    timer.rounds -= 1
+                    waiting.append(timer)
+                else:
+                    self.pending -= 1
+                    timer.callback(*timer.args)
+            self.wheel[self.position].extend(waiting)
+
+
+class Connection:
+    __slots__ = ('reactor', 'sock', 'fd', 'address', 'handler',
+                 'read_buffer', 'read_start', 'read_end', 'write_buffer', 'writing', 'closed', 'paused_by')
+
+    def __init__(self, reactor: 'Reactor', sock: socket.socket, address: Any, handler: Any):
+        self.reactor = reactor
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.address = address
+        self.handler = handler
+        self.read_buffer = bytearray(READ_BUFFER_SIZE)
+        self.read_start = 0
+        self.read_end = 0
+        self.write_buffer = bytearray()
+        self.writing = False
+        self.closed = False
+        self.paused_by: Set[str] = set()  # 'write_buffer' и/или 'budget'
+
+    # ---- чтение: данные лежат в read_buffer[read_start:read_end]
+
+    def readable(self) -> memoryview:
+        return memoryview(self.read_buffer)[self.read_start:self.read_end]
+
+    def consume(self, n_bytes: int):
+        self.read_start += n_bytes
+        if self.read_start == self.read_end:
+            self.read_start = self.read_end = 0
+
+    def _free_space(self) -> memoryview:
+        # Место под следующий recv_into: сначала сдвигаем необработанное
+        # в начало буфера и только если буфер заполнен целиком - растим его
+        if self.read_end == len(self.read_buffer):
+            if self.read_start:
+                unread = self.read_end - self.read_start
+                self.read_buffer[:unread] = self.read_buffer[self.read_start:self.read_end]
+                self.read_start, self.read_end = 0, unread
+            else:
+                self.read_buffer.extend(bytes(len(self.read_buffer)))
+        return memoryview(self.read_buffer)[self.read_end:]
+
+    # ---- запись
+
+    def write(self, data: Any):
+        if self.closed:
+            return
+        if not self.write_buffer:
+            try:
+                sent = self.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.close()
+                return
+            if sent == len(data):
+                return
+            data = memoryview(data)[sent:]
+        self.write_buffer += data
+        self.reactor.buffered += len(data)
+        if not self.writing:
+            self.writing = True
+            self.reactor._modify(self)
+        self.reactor._check_limits(self)
+
+    def _flush(self):
+        try:
+            sent = self.sock.send(self.write_buffer)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close()
+            return
+        del self.write_buffer[:sent]
+        self.reactor.buffered -= sent
+        if not self.write_buffer:
+            self.writing = False
+            self.reactor._modify(self)
+        self.reactor._check_drained(self)
+
+    def write_buffer_size(self) -> int:
+        return len(self.write_buffer)
+
+    def pause_reading(self, reason: str):
+        if not self.paused_by:
+            self.reactor.pauses += 1
+        self.paused_by.add(reason)
+
+    def resume_reading(self, reason: str):
+        self.paused_by.discard(reason)
+        if not self.paused_by and not self.closed:
+            # Данные могли прийти во время паузы, а повторного уведомления
+            # по фронту о них не будет
+            self.reactor._read(self)
+
+    def handler_call(self, method: str):
+        callback = getattr(self.handler, method, None)
+        if callback is not None:
+            callback(self)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.reactor._remove(self)
+            self.handler_call('connection_lost')
+
+
+class Reactor:
+    def __init__(self,
+                 max_events: int = 1024,
+                 high_water: int = 256 * 1024,
+                 low_water: int = 64 * 1024,
+                 budget_high: Optional[int] = 64 * 2 ** 20,
+                 budget_low: Optional[int] = None):
+        if not hasattr(select, 'epoll'):
+            raise RuntimeError('Реактору нужен epoll (Linux); на других ОС используйте selectors')
+        self.epoll = select.epoll()
+        self.max_events = max_events
+        self.high_water = high_water
+        self.low_water = low_water
+        self.budget_high = budget_high
+        self.budget_low = budget_low if budget_low is not None else (budget_high // 2 if budget_high else None)
+        self.buffered = 0
+        self.pauses = 0
+        self.over_budget: Set[Connection] = set()
+        self.timers = TimerWheel()
+        self.listeners: Dict[int, Tuple[socket.socket, Callable[[], Any]]] = {}
+        self.connections: Dict[int, Connection] = {}
+        self.running = False
+
+    def listen(self, address: Tuple[str, int], handler_factory: Callable[[], Any], reuse_port: bool = False) -> socket.socket:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.setblocking(False)
+        server_socket.bind(address)
+        server_socket.listen(1024)
+        self.listeners[server_socket.fileno()] = (server_socket, handler_factory)
+        self.epoll.register(server_socket.fileno(), select.EPOLLIN | select.EPOLLET)
+        return server_socket
+
+    def call_later(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        return self.timers.schedule(delay, callback, *args)
+
+    def stop(self):
+        self.running = False
+
+    def _events(self, connection: Connection) -> int:
+        events = select.EPOLLIN | select.EPOLLRDHUP | select.EPOLLET
+        return events | select.EPOLLOUT if connection.writing else events
+
+    def _modify(self, connection: Connection):
+        self.epoll.modify(connection.fd, self._events(connection))
+
+    def _check_limits(self, connection: Connection):
+        if len(connection.write_buffer) > self.high_water and 'write_buffer' not in connection.paused_by:
+            connection.pause_reading('write_buffer')
+        if self.budget_high is not None and self.buffered > self.budget_high and connection not in self.over_budget:
+            self.over_budget.add(connection)
+            connection.pause_reading('budget')
+
+    def _check_drained(self, connection: Connection):
+        if 'write_buffer' in connection.paused_by and len(connection.write_buffer) <= self.low_water:
+            connection.resume_reading('write_buffer')
+        self._check_budget()
+
+    def _check_budget(self):
+        # Вызывается при каждом уменьшении buffered: буферы освобождает
+        # не только отправка, но и закрытие соединения с неотправленными данными
+        if self.over_budget and self.buffered <= self.budget_low:
+            resumed, self.over_budget = self.over_budget, set()
+            for waiting in resumed:
+                waiting.resume_reading('budget')
+
+    @property
+    def paused_connections(self) -> int:
+        return sum(1 for connection in self.connections.values() if connection.paused_by)
+
+    def stats(self) -> Dict[str, int]:
+        return {'connections': len(self.connections),
+                'paused_connections': self.paused_connections,
+                'pauses': self.pauses,
+                'buffered_bytes': self.buffered}
+
+    def _remove(self, connection: Connection):
+        self.connections.pop(connection.fd, None)
+        self.buffered -= len(connection.write_buffer)
+        self.over_budget.discard(connection)
+        try:
+            self.epoll.unregister(connection.fd)
+        except OSError:
+            pass
+        connection.sock.close()
+        self._check_budget()
+
+    def _accept(self, server_socket: socket.socket, handler_factory: Callable[[], Any]):
+        while True:
+            try:
+                sock, address = server_socket.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = Connection(self, sock, address, handler_factory())
+            self.connections[connection.fd] = connection
+            self.epoll.register(connection.fd, self._events(connection))
+            connection.handler_call('connection_made')
+
+    def _read(self, connection: Connection):
+        # По фронту: читаем, пока ядро не ответит BlockingIOError,
+        # иначе следующего уведомления о тех же данных не будет
+        while not connection.closed and not connection.paused_by:
+            try:
+                received = connection.sock.recv_into(connection._free_space())
+            except BlockingIOError:
+                return
+            except OSError:
+                connection.close()
+                return
+            if not received:
+                connection.close()
+                return
+            connection.read_end += received
+            try:
+                connection.handler.data_received(connection)
+            except Exception as ex:
+                logging.exception(ex)
+                connection.close()
+                return
+
+    def run(self):
+        self.running = True
+        while self.running:
+            timeout = self.timers.next_timeout()
+            events = self.epoll.poll(-1 if timeout is None else timeout, self.max_events)
+            for fd, event in events:
+                listener = self.listeners.get(fd)
+                if listener is not None:
+                    self._accept(*listener)
+                    continue
+                connection = self.connections.get(fd)
+                if connection is None:
+                    continue
+                if event & select.EPOLLOUT and connection.writing:
+                    connection._flush()
+                if event & (select.EPOLLIN | select.EPOLLRDHUP | select.EPOLLHUP | select.EPOLLERR):
+                    self._read(connection)
+            self.timers.advance()
+
+    def close(self):
+        # Закрываемые соединения освобождают бюджет, но возобновлять чтение
+        # остальных уже незачем
+        self.over_budget.clear()
+        for connection in list(self.connections.values()):
+            connection.close()
+        for server_socket, _ in self.listeners.values():
+            self.epoll.unregister(server_socket.fileno())
+            server_socket.close()
+        self.listeners.clear()
+        self.epoll.close()
+
+
+# ==================================================================
+# Эхо-сервис из part_3_4 / part_3_5 на реакторе
+
+class EchoHandler:
+    def data_received(self, connection: Connection):
+        data = connection.readable()
+        if data == b'boom\r\n':
+            raise Exception("Неожиданная ошибка сети")
+        connection.write(data)
+        connection.consume(len(data))
+
+
+def main():
+    reactor = Reactor()
+    reactor.listen(('127.0.0.1', 8000), EchoHandler)
+
+    def report():
+        stats = reactor.stats()
+        print(f'Соединений {stats["connections"]}, приостановлено {stats["paused_connections"]}, '
+              f'всего пауз {stats["pauses"]}, в буферах записи {stats["buffered_bytes"]} байт')
+        reactor.call_later(10, report)
+
+    reactor.call_later(10, report)
+    try:
+        reactor.run()
+    finally:
+        reactor.close()
+
+
+if __name__ == "__main__":
+    main()
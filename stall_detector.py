@@ -0,0 +1,186 @@
+# Поиск блокировок цикла событий и вынос блокирующего кода из него
+#
+# cpu_bound_work и get_example_status из part_2_7 выглядят как сопрограммы,
+# но ни разу не отдают управление: пока они работают, цикл событий стоит.
+# В небольшом примере это видно по времени, в большом приложении - нет.
+#
+# StallDetector - режим наблюдения за циклом событий:
+#   - в цикле событий раз в period срабатывает "пульс" (call_later);
+#   - отдельный поток-сторож проверяет, не опаздывает ли пульс, и, пока
+#     опаздывает, снимает стек потока цикла событий (sys._current_frames)
+#     и запоминает текущую задачу;
+#   - когда пульс все же срабатывает с опозданием больше threshold, по
+#     собранным снимкам печатается, какая задача и какая строка держала цикл.
+# Снимки делаются только во время блокировки, так что в обычной работе
+# сторож почти ничего не стоит и режим можно не выключать.
+#
+# offload('thread' | 'process') - декоратор, который переносит тело
+# сопрограммы в пул потоков (блокирующий ввод-вывод, как requests.get)
+# или в пул процессов (счетный код, как cpu_bound_work). Снаружи функция
+# остается сопрограммой, и вызывающий код менять не нужно.
+
+import asyncio
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class Stall(NamedTuple):
+    duration: float
+    task: Optional[str]
+    location: Optional[str]
+    stack: List[str]
+
+
+def _user_frame(stack: traceback.StackSummary) -> Optional[traceback.FrameSummary]:
+    # Самый внутренний кадр не из asyncio - строка, которая держит цикл
+    for frame in reversed(stack):
+        if f'{os.sep}asyncio{os.sep}' not in frame.filename:
+            return frame
+    return None
+
+
+class StallDetector:
+    def __init__(self,
+                 threshold: float = 0.1,
+                 sample_interval: Optional[float] = None,
+                 on_stall: Optional[Callable[[Stall], Any]] = None):
+        self.threshold = threshold
+        self.period = threshold / 2
+        self.sample_interval = sample_interval or threshold / 5
+        self.on_stall = on_stall or self.print_stall
+        self.stalls: List[Stall] = []
+        self._samples: List[tuple] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._expected = 0.0
+
+    def start(self):
+        # Вызывается в потоке цикла событий
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._expected = time.perf_counter() + self.period
+        self._handle = self._loop.call_later(self.period, self._beat)
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._handle.cancel()
+        self._stopped.set()
+        self._watchdog.join()
+
+    async def __aenter__(self) -> 'StallDetector':
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.stop()
+
+    def _beat(self):
+        now = time.perf_counter()
+        lag = now - self._expected
+        with self._lock:
+            samples, self._samples = self._samples, []
+        if lag > self.threshold:
+            self._report(lag, samples)
+        self._expected = now + self.period
+        self._handle = self._loop.call_later(self.period, self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.sample_interval):
+            if time.perf_counter() - self._expected < self.sample_interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self._loop)
+            sample = (task.get_name() if task else None,
+                      task.get_coro().__qualname__ if task else None,
+                      traceback.extract_stack(frame))
+            del frame
+            with self._lock:
+                self._samples.append(sample)
+
+    def _report(self, lag: float, samples: List[tuple]):
+        task, location, stack = None, None, []
+        if samples:
+            # Место, чаще всего попадавшее в снимки, и стек одного из таких снимков
+            places = Counter()
+            by_place = {}
+            for name, coro, sample_stack in samples:
+                frame = _user_frame(sample_stack)
+                place = f'{frame.filename}:{frame.lineno} в {frame.name}' if frame else None
+                places[place] += 1
+                by_place[place] = (f'{name} ({coro})' if name else None, sample_stack)
+            location = places.most_common(1)[0][0]
+            task, sample_stack = by_place[location]
+            stack = sample_stack.format()[-5:]
+        stall = Stall(lag, task, location, stack)
+        self.stalls.append(stall)
+        self.on_stall(stall)
+
+    @staticmethod
+    def print_stall(stall: Stall):
+        print(f'Цикл событий заблокирован на {stall.duration:.3f} с, '
+              f'задача {stall.task or "неизвестна"}, место {stall.location or "неизвестно"}')
+
+
+# ==================================================================
+# Перенос тела сопрограммы в пул потоков или процессов
+
+OFFLOAD_MODES = ('thread', 'process')
+
+_executors: Dict[str, Executor] = {}
+
+
+def get_offload_executor(mode: str) -> Executor:
+    if mode not in OFFLOAD_MODES:
+        raise ValueError(f'Неизвестный режим {mode}, ожидается один из {OFFLOAD_MODES}')
+    if mode not in _executors:
+        _executors[mode] = ThreadPoolExecutor() if mode == 'thread' else ProcessPoolExecutor()
+    return _executors[mode]
+
+
+def _run_body(func: Callable, args: tuple, kwargs: dict) -> Any:
+    # Тело выполняется в своем цикле событий, поэтому внутри можно и await
+    return asyncio.run(func(*args, **kwargs))
+
+
+def _run_by_name(module: str, qualname: str, args: tuple, kwargs: dict) -> Any:
+    # Декорированная функция под своим именем в модуле - это обертка,
+    # поэтому в процесс передается имя, а исходная функция берется из
+    # атрибута _offloaded (functools.wraps копирует его и во внешние обертки)
+    target: Any = importlib.import_module(module)
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return _run_body(target._offloaded, args, kwargs)
+
+
+def offload(mode: str = 'thread', executor: Optional[Executor] = None) -> Callable:
+    def wrapper(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs) -> Any:
+            loop = asyncio.get_running_loop()
+            pool = executor or get_offload_executor(mode)
+            if mode == 'process':
+                call = functools.partial(_run_by_name, func.__module__, func.__qualname__, args, kwargs)
+            else:
+                call = functools.partial(_run_body, func, args, kwargs)
+            return await loop.run_in_executor(pool, call)
+        wrapped._offloaded = func
+        return wrapped
+    return wrapper
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
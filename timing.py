@@ -0,0 +1,145 @@
+# Хронометраж сопрограмм без печати на каждый вызов
+#
+# Декоратор async_timed из листинга 2.16 (он же был скопирован в utils.py,
+# part_2_6.py, Competitive_web_requests/utils.py и
+# Non_blocking_database_drivers/utils.py) на каждом вызове печатает две
+# строки с repr всех аргументов и меряет время по time.time(). При 10 000
+# запросов в query_products_concurrently форматирование и вывод стоят
+# дороже самих измерений, а time.time() может прыгать при подводке часов.
+#
+# Здесь async_timed - единственная версия декоратора:
+#   - время меряется монотонным perf_counter_ns и записывается в гистограмму
+#     своей функции (histogram.Histogram), строки на вызове не собираются;
+#   - sample_rate < 1 - измеряется только каждый 1 / sample_rate-й вызов;
+#   - сводка (число вызовов, p50/p95/p99, максимум) печатается по запросу
+#     (print_summary), периодически (summary_reporter) и при выходе из программы.
+#
+# Примеры в подпапках запускаются из своей папки, поэтому их utils.py
+# добавляют корень репозитория в sys.path - в конец, чтобы корневой utils.py
+# не заслонил utils.py папки, - и реэкспортируют async_timed и все, что
+# нужно из tracing. Остальные модули папки берут эти имена только из utils.
+
+import asyncio
+import atexit
+import functools
+import itertools
+import time
+from typing import Any, Callable, Dict, Optional
+
+import tracing
+from histogram import Histogram
+
+NS_IN_MS = 1_000_000
+
+_histograms: Dict[str, Histogram] = {}
+
+
+def async_timed(sample_rate: float = 1.0, name: Optional[str] = None):
+    def wrapper(func: Callable) -> Callable:
+        key = name or f'{func.__module__}.{func.__qualname__}'
+        histogram = _histograms.setdefault(key, Histogram())
+        every = max(1, round(1 / sample_rate))
+        calls = itertools.count()
+
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs) -> Any:
+            # При включенной трассировке вызов становится интервалом (tracing.py)
+            opened = tracing.begin_span(key) if tracing.is_enabled() else None
+            try:
+                if every > 1 and next(calls) % every:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.record(time.perf_counter_ns() - start)
+            finally:
+                if opened is not None:
+                    tracing.end_span(opened)
+        return wrapped
+    return wrapper
+
+
+def summary() -> Dict[str, dict]:
+    return {key: histogram.summary() for key, histogram in _histograms.items() if histogram.count}
+
+
+def reset():
+    for histogram in _histograms.values():
+        histogram.reset()
+
+
+def format_summary() -> str:
+    lines = []
+    for key, histogram in _histograms.items():
+        if not histogram.count:
+            continue
+        p50, p95, p99 = histogram.percentiles((50, 95, 99)).values()
+        lines.append(f'{key}: измерено вызовов {histogram.count}, '
+                     f'p50 {p50 / NS_IN_MS:.3f} мс, p95 {p95 / NS_IN_MS:.3f} мс, '
+                     f'p99 {p99 / NS_IN_MS:.3f} мс, максимум {histogram.max / NS_IN_MS:.3f} мс')
+    return '\n'.join(lines)
+
+
+def print_summary(clear: bool = False):
+    report = format_summary()
+    if report:
+        print(report)
+    if clear:
+        reset()
+
+
+async def summary_reporter(interval: float = 10.0, clear: bool = True):
+    # Фоновая задача: сводка за каждый интервал; снимается вызывающей стороной
+    while True:
+        await asyncio.sleep(interval)
+        print_summary(clear)
+
+
+# Сводка при выходе - замена построчной печати в примерах книги
+atexit.register(print_summary)
+
+
+# ==================================================================
+# Сравнение с async_timed из листинга 2.16 на 10 000 вызовов
+
+def print_timed():
+    # Версия из листинга 2.16, для сравнения
+    def wrapper(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs) -> Any:
+            print(f'выполняется {func} с аргументами {args} {kwargs}')
+            start = time.time()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                end = time.time()
+                total = end - start
+                print(f'{func} завершилась за {total:.4f} с')
+        return wrapped
+    return wrapper
+
+
+async def benchmark(calls: int = 10_000):
+    import contextlib
+    import io
+
+    async def query(product_id: int, rows: list) -> int:
+        return product_id
+
+    rows = [{'product_id': index, 'size': 'M'} for index in range(20)]
+    variants = [('print', print_timed()(query)),
+                ('histogram', async_timed(name='benchmark.query')(query)),
+                ('histogram, 1 %', async_timed(sample_rate=0.01, name='benchmark.query_sampled')(query)),
+                ('без хронометража', query)]
+    for label, timed_query in variants:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            await asyncio.gather(*[timed_query(index, rows) for index in range(calls)])
+            elapsed = time.perf_counter() - start
+        print(f'{label}: {elapsed:.4f} с')
+    print_summary(clear=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
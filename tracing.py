@@ -0,0 +1,228 @@
+# Трассировка сопрограмм: вложенные интервалы (spans) через contextvars
+#
+# async_timed дает время каждой функции отдельно. Когда main запускает через
+# gather сотню fetch_status, видно, что main работала долго, но не видно,
+# какой из дочерних вызовов ее задержал. Здесь каждый вызов - интервал
+# со ссылкой на родителя:
+#   - текущий интервал хранится в ContextVar; asyncio копирует контекст при
+#     создании задачи, поэтому задачи из gather или create_task получают
+#     родителем тот интервал, в котором их создали;
+#   - traced() - декоратор для сопрограмм, span(name) - контекстный менеджер
+#     (обычный и асинхронный) для участков кода, например pool.acquire();
+#   - async_timed из timing.py при включенной трассировке тоже открывает интервал;
+#   - export_chrome_trace пишет файл в формате Chrome trace event, который
+#     открывается без сети в chrome://tracing или https://ui.perfetto.dev
+#     (файл загружается локально), а format_tree печатает дерево в консоль.
+#
+# По умолчанию трассировка выключена (enable()), и тогда интервалы
+# не создаются: остается одна проверка флага на вызов.
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'lane', 'args')
+
+    def __init__(self, name: str, span_id: int, parent_id: Optional[int], lane: int, args: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.lane = lane
+        self.args = args
+        self.start = time.perf_counter_ns()
+        self.end = 0
+
+    @property
+    def duration(self) -> int:
+        return self.end - self.start
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+_enabled = False
+
+_spans: List[Span] = []
+
+_ids = itertools.count(1)
+
+# Дорожка (tid в Chrome trace) - своя у каждой задачи: интервалы одной
+# задачи вложены друг в друга, а параллельные задачи не накладываются
+_lanes: 'weakref.WeakKeyDictionary[asyncio.Task, int]' = weakref.WeakKeyDictionary()
+
+_lane_names: Dict[int, str] = {}
+
+_lane_ids = itertools.count(1)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    _spans.clear()
+    _lanes.clear()
+    _lane_names.clear()
+
+
+def _lane() -> int:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        lane = threading.get_ident()
+        _lane_names.setdefault(lane, threading.current_thread().name)
+        return lane
+    lane = _lanes.get(task)
+    if lane is None:
+        lane = _lanes[task] = next(_lane_ids)
+        _lane_names[lane] = task.get_name()
+    return lane
+
+
+def begin_span(name: str, **args: Any) -> Tuple[Span, Token]:
+    parent = _current.get()
+    span_ = Span(name, next(_ids), parent.span_id if parent else None, _lane(), args)
+    return span_, _current.set(span_)
+
+
+def end_span(opened: Tuple[Span, Token]):
+    span_, token = opened
+    span_.end = time.perf_counter_ns()
+    _current.reset(token)
+    _spans.append(span_)
+
+
+class span:
+    # with span('этап'): ...  или  async with span('pool.acquire'): ...
+    def __init__(self, name: str, **args: Any):
+        self.name = name
+        self.args = args
+        self._opened: Optional[Tuple[Span, Token]] = None
+
+    def __enter__(self) -> 'span':
+        if _enabled:
+            self._opened = begin_span(self.name, **self.args)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._opened is not None:
+            end_span(self._opened)
+            self._opened = None
+
+    async def __aenter__(self) -> 'span':
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__(*exc_info)
+
+
+def traced(name: Optional[str] = None):
+    def wrapper(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs) -> Any:
+            if not _enabled:
+                return await func(*args, **kwargs)
+            opened = begin_span(span_name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                end_span(opened)
+        return wrapped
+    return wrapper
+
+
+def export_chrome_trace(path: str) -> int:
+    # Событие 'X' (complete) - интервал с началом и длительностью в микросекундах,
+    # события 'M' задают имена дорожек. Возвращает число записанных интервалов.
+    pid = os.getpid()
+    origin = min((span_.start for span_ in _spans), default=0)
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': lane, 'args': {'name': lane_name}}
+              for lane, lane_name in _lane_names.items()]
+    for span_ in _spans:
+        events.append({
+            'name': span_.name,
+            'cat': 'asyncio',
+            'ph': 'X',
+            'ts': (span_.start - origin) / 1000,
+            'dur': span_.duration / 1000,
+            'pid': pid,
+            'tid': span_.lane,
+            'args': {'span_id': span_.span_id, 'parent_id': span_.parent_id, **span_.args},
+        })
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+    return len(_spans)
+
+
+def format_tree(max_children: int = 10) -> str:
+    # Дети каждого интервала - от самого долгого к самому короткому;
+    # показываются первые max_children, остальные сводятся в одну строку
+    children: Dict[Optional[int], List[Span]] = {}
+    for span_ in _spans:
+        children.setdefault(span_.parent_id, []).append(span_)
+    lines: List[str] = []
+
+    def walk(parent_id: Optional[int], depth: int):
+        kids = sorted(children.get(parent_id, []), key=lambda span_: span_.duration, reverse=True)
+        for span_ in kids[:max_children]:
+            lines.append(f'{"  " * depth}{span_.name} {span_.duration / 1e6:.3f} мс')
+            walk(span_.span_id, depth + 1)
+        if len(kids) > max_children:
+            lines.append(f'{"  " * depth}... еще {len(kids) - max_children}')
+
+    walk(None, 0)
+    return '\n'.join(lines)
+
+
+# ==================================================================
+# main -> сотня fetch_status, один из которых медленный
+
+async def main():
+    from timing import async_timed
+
+    @traced()
+    async def fetch_status(url: str, delay: float) -> int:
+        async with span('connect'):
+            await asyncio.sleep(delay / 10)
+        await asyncio.sleep(delay)
+        return 200
+
+    @async_timed()
+    async def fetch_all():
+        delays = [0.01] * 99 + [0.5]
+        return await asyncio.gather(*[fetch_status(f'http://example.com/{index}', delay)
+                                      for index, delay in enumerate(delays)])
+
+    enable()
+    await fetch_all()
+    print(format_tree(max_children=3))
+    print(f'Записано интервалов: {export_chrome_trace("fetch_all.trace.json")}, файл fetch_all.trace.json')
+
+
+if __name__ == "__main__":
+    # timing импортирует модуль tracing, а не __main__, поэтому флаг
+    # трассировки и список интервалов должны быть из того же модуля
+    import tracing
+    asyncio.run(tracing.main())
@@ -1,7 +1,7 @@
 import asyncio
-import functools
-import time
-from typing import Callable, Any
+
+# Общий декоратор хронометража (раньше здесь была копия листинга 2.16)
+from timing import async_timed
 
 
 async def delay(delay_seconds: int) -> int:
@@ -9,19 +9,3 @@ async def delay(delay_seconds: int) -> int:
     await asyncio.sleep(delay_seconds)
     print(f'сон в течение {delay_seconds} с закончился')
     return delay_seconds
-
-
-def async_timed():
-    def wrapper(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapped(*args, **kwargs) -> Any:
-            print(f'выполняется {func} с аргументами {args} {kwargs}')
-            start = time.time()
-            try:
-                return await func(*args, **kwargs)
-            finally:
-                end = time.time()
-                total = end - start
-                print(f'{func} завершилась за {total:.4f} с')
-        return wrapped
-    return wrapper